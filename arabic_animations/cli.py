@@ -1,7 +1,20 @@
+import asyncio
 import click
 import cv2
-from typing import Dict, Any, Optional
+import json
+import os
+import sys
+import time
+from typing import Dict, Any, Optional, Tuple
 from .utils.preview import LivePreview
+from .utils.loader import load_scene
+from .core.renderer import parallel_video_pipeline, video_pipeline
+from .utils.profiling import profiler
+from .core.cache import outline_store
+from .core.batch import load_manifest, run_batch
+from .core.segments import (SegmentInfo, chunk_range, is_complete, merge_segments, parse_chunk,
+                            partial_path, script_digest, write_segment_info)
+from .service import RenderService, serve as run_service
 import logging
 from arabic_animations import __version__
 
@@ -12,6 +25,13 @@ formatter = logging.Formatter('%(message)s')
 handler.setFormatter(formatter)
 logger.addHandler(handler)
 
+def _use_cache_dir(cache_dir: Optional[str]) -> None:
+    """Keep text outlines in cache_dir, if given"""
+    if cache_dir:
+        # Worker processes and preview reloads read the store from the environment
+        os.environ['ATA_CACHE_DIR'] = cache_dir
+        outline_store.open(cache_dir)
+
 @click.group()
 def cli() -> None:
     """Arabic Animations CLI"""
@@ -21,12 +41,30 @@ def cli() -> None:
 @click.argument('script_path', type=click.Path(exists=True))
 @click.option('--preview', is_flag=True, help="Show live preview")
 @click.option('--output', type=click.Path(), help="Output video path")
+@click.option('--workers', type=click.IntRange(min=1), default=1, show_default=True,
+              help="Number of processes rendering frames in parallel")
+@click.option('--memory-limit', type=click.IntRange(min=1), default=1024, show_default=True,
+              help="MiB of frames rendered by --workers that may wait to be written in order")
+@click.option('--profile', is_flag=True, help="Print the time spent in each rendering stage")
+@click.option('--profile-output', type=click.Path(),
+              help="Write profiling data to a JSON file in Chrome trace format")
+@click.option('--cache-dir', type=click.Path(file_okay=False), envvar='ATA_CACHE_DIR',
+              help="Keep text outlines in this directory to reuse them in later runs")
+@click.option('--start-frame', type=click.IntRange(min=0), help="Index of the first frame to render")
+@click.option('--end-frame', type=click.IntRange(min=0), help="Index one past the last frame to render")
+@click.option('--chunk', help="Render only chunk i of N equal chunks, written as i/N and numbered from 1")
+@click.option('--resume', is_flag=True, help="Skip rendering if the output already holds the same segment")
 @click.option('-v', '--verbose', is_flag=True, help="Enable verbose output")
-def render(script_path: str, preview: bool, output: Optional[str], verbose: bool) -> None:
+def render(script_path: str, preview: bool, output: Optional[str], workers: int, memory_limit: int,
+           profile: bool, profile_output: Optional[str], cache_dir: Optional[str],
+           start_frame: Optional[int], end_frame: Optional[int], chunk: Optional[str],
+           resume: bool, verbose: bool) -> None:
     """Render animation from script"""
     # Set logging level based on verbosity
     logger.setLevel(logging.DEBUG if verbose else logging.INFO)
 
+    _use_cache_dir(cache_dir)
+
     logger.debug(f"Loading script: {script_path}")
 
     if preview:
@@ -35,36 +73,186 @@ def render(script_path: str, preview: bool, output: Optional[str], verbose: bool
         preview_window.start()
         return
 
-    # Load scene for rendering
-    namespace = {}
-    with open(script_path) as f:
-        script_content = f.read()
-        logger.debug(f"Script content:\n{script_content}")
-        exec(script_content, namespace)
+    if profile or profile_output:
+        profiler.enable(trace=bool(profile_output))
 
-    scene = namespace.get('scene')
+    # Load scene for rendering
+    scene = load_scene(script_path)
     if not scene:
         click.echo("Error: Script must define a 'scene' object")
         return
 
     if output:
-        logger.info(f"Rendering to {output}...")
-        # Render to video file
+        duration = scene.duration
+        scene_frames = int(duration * scene.fps)
+
+        # Select the segment of frames to render
+        if chunk and (start_frame is not None or end_frame is not None):
+            raise click.UsageError("--chunk cannot be combined with --start-frame or --end-frame")
+        if chunk:
+            try:
+                first, last = chunk_range(scene_frames, *parse_chunk(chunk))
+            except ValueError as e:
+                raise click.BadParameter(str(e), param_hint="'--chunk'")
+        else:
+            first = start_frame or 0
+            last = scene_frames if end_frame is None else min(end_frame, scene_frames)
+            if first > last:
+                raise click.BadParameter(f"must not be after --end-frame ({last})", param_hint="'--start-frame'")
+        total_frames = last - first
+        segment = SegmentInfo(script_digest(script_path), first, last,
+                              scene.fps, scene.width, scene.height)
+
+        if resume and is_complete(output, segment):
+            logger.info(f"{output} already holds frames {first} to {last}, skipping")
+            return
+
+        if total_frames == 0:
+            logger.warning(f"No frames between {first} and {last}, nothing to render")
+            return
+
+        logger.info(f"Rendering frames {first} to {last} to {output}...")
+        # Render to a partial file that only replaces the output once complete
+        partial = partial_path(output)
         fourcc = cv2.VideoWriter_fourcc(*'mp4v')
-        out = cv2.VideoWriter(output, fourcc, scene.fps,
+        out = cv2.VideoWriter(partial, fourcc, scene.fps,
                             (scene.width, scene.height))
+        if not out.isOpened():
+            raise click.ClickException(f"Could not open a video writer for {partial}")
 
-        duration = scene.duration
-        total_frames = int(duration * scene.fps)
+        if workers > 1:
+            logger.debug(f"Rendering with {workers} worker processes")
+            if profiler.enabled:
+                logger.info("Stages running inside worker processes are not profiled")
+            pipeline = parallel_video_pipeline(script_path, out, first, last, workers,
+                                               memory_limit=memory_limit << 20)
+        else:
+            pipeline = video_pipeline(scene, out, first, last)
 
-        with click.progressbar(range(total_frames), label='Rendering') as frames:
-            for t in frames:
-                frame = scene.render_frame(t / scene.fps)
-                out.write(cv2.cvtColor(frame, cv2.COLOR_BGRA2BGR))
+        start = time.perf_counter()
+        written = 0
+        with click.progressbar(pipeline, length=total_frames, label='Rendering') as bar:
+            for _ in bar:
+                written += 1
+        elapsed = time.perf_counter() - start
 
         out.release()
+        if written != total_frames or not os.path.exists(partial):
+            raise click.ClickException(f"Only {written} of {total_frames} frames were written to {partial}, "
+                                       f"keeping {output} unchanged")
+        os.replace(partial, output)
+        if resume or chunk or start_frame is not None or end_frame is not None:
+            # Record what the segment holds, for resuming and merging
+            write_segment_info(output, segment)
+        for stats in pipeline.stats:
+            logger.info(f"{stats.name:>8}: {stats.frames} frames in {stats.seconds:.2f}s ({stats.fps:.1f} fps)")
+        if elapsed > 0:
+            logger.info(f"{'total':>8}: {total_frames} frames in {elapsed:.2f}s ({total_frames / elapsed:.1f} fps)")
+
+        if profile:
+            click.echo(profiler.format_summary())
+        if profile_output:
+            with open(profile_output, 'w') as f:
+                json.dump(profiler.chrome_trace(), f)
+            logger.info(f"Profile written to {profile_output}")
         logger.info("Done!")
 
+@cli.command()
+@click.argument('manifest', type=click.Path(exists=True, dir_okay=False))
+@click.option('--output-dir', type=click.Path(file_okay=False),
+              help="Directory relative output paths are resolved against [default: the manifest's directory]")
+@click.option('--workers', type=click.IntRange(min=1), default=os.cpu_count() or 1,
+              show_default="number of CPUs", help="Number of processes rendering clips in parallel")
+@click.option('--cache-dir', type=click.Path(file_okay=False), envvar='ATA_CACHE_DIR',
+              help="Keep text outlines in this directory to reuse them in later runs")
+@click.option('--report', type=click.Path(dir_okay=False),
+              help="Write the result of every job to this file as JSON Lines")
+@click.option('-v', '--verbose', is_flag=True, help="Enable verbose output")
+def batch(manifest: str, output_dir: Optional[str], workers: int, cache_dir: Optional[str],
+          report: Optional[str], verbose: bool) -> None:
+    """Render a clip for every entry of a CSV or JSON Lines manifest"""
+    logger.setLevel(logging.DEBUG if verbose else logging.INFO)
+    _use_cache_dir(cache_dir)
+
+    try:
+        jobs = load_manifest(manifest, output_dir)
+    except (OSError, ValueError) as e:
+        raise click.ClickException(str(e))
+    if not jobs:
+        click.echo("Manifest has no entries")
+        return
+
+    logger.info(f"Rendering {len(jobs)} clips with {workers} workers...")
+    report_file = open(report, 'w', encoding='utf-8') if report else None
+    failed = frames = 0
+    start = time.perf_counter()
+    try:
+        for done, result in enumerate(run_batch(jobs, workers), 1):
+            progress = f"[{done}/{len(jobs)}]"
+            if result.ok:
+                frames += result.frames
+                click.echo(f"{progress} ok     {result.output} "
+                           f"({result.frames} frames in {result.seconds:.2f}s)")
+            else:
+                failed += 1
+                click.echo(f"{progress} failed {result.output}: {result.error}", err=True)
+            if report_file:
+                report_file.write(json.dumps({"job": result.index, "output": result.output,
+                                              "ok": result.ok, "frames": result.frames,
+                                              "seconds": result.seconds, "error": result.error}) + "\n")
+                report_file.flush()
+    finally:
+        if report_file:
+            report_file.close()
+    elapsed = time.perf_counter() - start
+
+    logger.info(f"{len(jobs) - failed} succeeded, {failed} failed in {elapsed:.2f}s "
+                f"({len(jobs) / elapsed:.2f} clips/s, {frames / elapsed:.1f} fps)")
+    if failed:
+        sys.exit(1)
+
+@cli.command()
+@click.argument('output', type=click.Path(dir_okay=False))
+@click.argument('segments', nargs=-1, required=True, type=click.Path(exists=True, dir_okay=False))
+@click.option('-v', '--verbose', is_flag=True, help="Enable verbose output")
+def merge(output: str, segments: Tuple[str, ...], verbose: bool) -> None:
+    """Join segments rendered with --chunk or --start-frame into one video without re-encoding"""
+    logger.setLevel(logging.DEBUG if verbose else logging.INFO)
+    try:
+        merge_segments(segments, output)
+    except (RuntimeError, ValueError) as e:
+        raise click.ClickException(str(e))
+    logger.info(f"Merged {len(segments)} segments into {output}")
+
+@cli.command()
+@click.option('--host', default='127.0.0.1', show_default=True, help="Address to listen on")
+@click.option('--port', type=int, default=8750, show_default=True, help="Port to listen on")
+@click.option('--socket', 'socket_path', type=click.Path(dir_okay=False),
+              help="Listen on this Unix socket instead of a TCP port")
+@click.option('--output-dir', type=click.Path(file_okay=False), default='renders', show_default=True,
+              help="Directory rendered clips are written to")
+@click.option('--workers', type=click.IntRange(min=1), default=os.cpu_count() or 1,
+              show_default="number of CPUs", help="Number of clips rendered at once")
+@click.option('--max-queue', type=click.IntRange(min=1), default=64, show_default=True,
+              help="Number of waiting jobs beyond which new jobs are rejected")
+@click.option('--warm-font', default="DecoType Thuluth", show_default=True,
+              help="Font every worker loads when it starts")
+@click.option('--cache-dir', type=click.Path(file_okay=False), envvar='ATA_CACHE_DIR',
+              help="Keep text outlines in this directory to reuse them in later runs")
+@click.option('-v', '--verbose', is_flag=True, help="Enable verbose output")
+def serve(host: str, port: int, socket_path: Optional[str], output_dir: str, workers: int,
+          max_queue: int, warm_font: str, cache_dir: Optional[str], verbose: bool) -> None:
+    """Run a local render service accepting jobs over HTTP"""
+    logger.setLevel(logging.DEBUG if verbose else logging.INFO)
+    _use_cache_dir(cache_dir)
+
+    service = RenderService(output_dir, workers=workers, max_queue=max_queue, warm_font=warm_font)
+    logger.info(f"Starting {workers} workers...")
+    try:
+        asyncio.run(run_service(service, host, port, socket_path))
+    except KeyboardInterrupt:
+        logger.info("Stopped")
+
 @cli.command()
 def docs() -> None:
     """Start the documentation server"""
@@ -0,0 +1,260 @@
+import csv
+import json
+import logging
+import multiprocessing
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+import cv2
+import numpy as np
+from .color import Style
+from .scene import Scene
+from .text import Text
+from .renderer import to_bgr
+
+logger = logging.getLogger('arabic_animations')
+
+# Manifest columns and the BatchJob fields they set
+MANIFEST_FIELDS = {
+    'text': 'text',
+    'output': 'output',
+    'font': 'font_name',
+    'size': 'font_size',
+    'style': 'style',
+    'duration': 'duration',
+    'width': 'width',
+    'height': 'height',
+    'fps': 'fps',
+}
+
+@dataclass
+class BatchJob:
+    """
+    A single clip of a batch: one text written on its own scene
+
+    Args:
+        text: The text to write
+        output: Path of the video file to write
+        font_name: Name of the font to use
+        font_size: Size of the font in points
+        style: Style fields as accepted by Style.from_dict
+        duration: Duration of the writing animation in seconds
+        width: Width of the clip in pixels
+        height: Height of the clip in pixels
+        fps: Frames per second of the clip
+    """
+    text: str
+    output: str
+    font_name: str = "DecoType Thuluth"
+    font_size: int = 72
+    style: Dict[str, Any] = field(default_factory=dict)
+    duration: float = 1.0
+    width: int = 1920
+    height: int = 1080
+    fps: int = 60
+
+    def build_scene(self) -> Scene:
+        """Create the scene of the clip"""
+        style = Style.from_dict(self.style)
+        scene = Scene(width=self.width, height=self.height, fps=self.fps)
+        scene.background_color = style.background_color
+        scene.add(Text(self.text, font_name=self.font_name, font_size=self.font_size,
+                       style=style, write_duration=self.duration))
+        return scene
+
+@dataclass
+class BatchResult:
+    """Outcome of a batch job"""
+    index: int
+    output: str
+    frames: int = 0
+    seconds: float = 0.0
+    error: Optional[str] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+def job_from_record(record: Dict[str, Any], output_dir: Path) -> BatchJob:
+    """Create a job from a manifest entry, where empty values keep their defaults"""
+    unknown = set(record) - set(MANIFEST_FIELDS)
+    if unknown:
+        raise ValueError(f"unknown columns {', '.join(sorted(unknown))}")
+
+    values: Dict[str, Any] = {}
+    for column, value in record.items():
+        if value is None or value == '':
+            continue
+        name = MANIFEST_FIELDS[column]
+        if name == 'style':
+            value = json.loads(value) if isinstance(value, str) else value
+            if not isinstance(value, dict):
+                raise ValueError("style must be an object")
+        elif name in ('font_size', 'width', 'height', 'fps'):
+            value = int(value)
+        elif name == 'duration':
+            value = float(value)
+        elif name == 'output':
+            value = str(output_dir / value)
+        else:
+            value = str(value)
+        values[name] = value
+
+    for required in ('text', 'output'):
+        if required not in values:
+            raise ValueError(f"missing {required}")
+    return BatchJob(**values)
+
+def load_manifest(path: str, output_dir: Optional[str] = None) -> List[BatchJob]:
+    """
+    Read batch jobs from a manifest
+
+    A manifest is a CSV file with a header row, or a JSON Lines file with
+    one object per line, chosen by the .csv or .jsonl extension. Entries
+    have the columns text, output, font, size, style, duration, width,
+    height and fps, of which only text and output are required. In CSV
+    files the style is a JSON object in a single cell.
+
+    Args:
+        path: Path to the manifest
+        output_dir: Directory relative output paths are resolved against,
+            the manifest's directory by default
+
+    Returns:
+        Jobs in manifest order
+
+    Raises:
+        ValueError: If an entry is invalid, naming its line
+    """
+    manifest = Path(path)
+    base = Path(output_dir) if output_dir else manifest.parent
+    suffix = manifest.suffix.lower()
+
+    with open(manifest, newline='', encoding='utf-8') as f:
+        if suffix == '.csv':
+            # Line 1 is the header
+            records = [(number, record) for number, record in enumerate(csv.DictReader(f), 2)]
+        elif suffix in ('.jsonl', '.ndjson'):
+            records = []
+            for number, line in enumerate(f, 1):
+                if line.strip():
+                    try:
+                        records.append((number, json.loads(line)))
+                    except json.JSONDecodeError as e:
+                        raise ValueError(f"{path}:{number}: {e}") from e
+        else:
+            raise ValueError(f"Unsupported manifest format '{manifest.suffix}', use .csv or .jsonl")
+
+    jobs = []
+    for number, record in records:
+        try:
+            if not isinstance(record, dict):
+                raise ValueError("entry must be an object")
+            jobs.append(job_from_record(record, base))
+        except (ValueError, TypeError) as e:
+            raise ValueError(f"{path}:{number}: {e}") from e
+    return jobs
+
+def render_job(job: BatchJob, progress: Optional[Callable[[int, int], None]] = None) -> int:
+    """
+    Render a job to its output file
+
+    Args:
+        job: Job to render
+        progress: Called with the number of frames written and the total,
+            about a hundred times over the clip
+
+    Returns:
+        Number of frames written
+    """
+    scene = job.build_scene()
+    total_frames = int(scene.duration * scene.fps)
+
+    Path(job.output).parent.mkdir(parents=True, exist_ok=True)
+    writer = cv2.VideoWriter(job.output, cv2.VideoWriter_fourcc(*'mp4v'), scene.fps,
+                             (scene.width, scene.height))
+    if not writer.isOpened():
+        raise IOError(f"Could not open {job.output} for writing")
+
+    frame = np.empty((scene.height, scene.width, 4), dtype=np.uint8)
+    bgr = np.empty((scene.height, scene.width, 3), dtype=np.uint8)
+    step = max(1, total_frames // 100)
+    previous = None
+    try:
+        for index in range(total_frames):
+            t = index / scene.fps
+            key = scene.frame_key(t)
+            # A repeated frame is written again without rendering it
+            if index == 0 or key is None or key != previous:
+                to_bgr(scene.render_frame(t, frame), bgr)
+            previous = key
+            writer.write(bgr)
+            if progress and ((index + 1) % step == 0 or index + 1 == total_frames):
+                progress(index + 1, total_frames)
+    except Exception:
+        writer.release()
+        # Do not leave a truncated clip behind
+        Path(job.output).unlink(missing_ok=True)
+        raise
+    writer.release()
+    return total_frames
+
+def _run_job(item: Tuple[int, BatchJob]) -> BatchResult:
+    """Render a job, reporting any error in the result instead of raising it"""
+    index, job = item
+    start = time.perf_counter()
+    try:
+        frames = render_job(job)
+    except Exception as e:
+        logger.debug(traceback.format_exc())
+        return BatchResult(index, job.output, seconds=time.perf_counter() - start,
+                           error=f"{type(e).__name__}: {e}")
+    return BatchResult(index, job.output, frames, time.perf_counter() - start)
+
+def _init_batch_worker() -> None:
+    logger.setLevel(logging.WARNING)
+
+def run_batch(jobs: Sequence[BatchJob], workers: int = 1) -> Iterator[BatchResult]:
+    """
+    Render batch jobs and yield their results as they finish
+
+    Worker processes are started once and render many jobs each, so the
+    font map and the layout and outline caches stay warm from one clip to
+    the next. A job that fails is reported in its result and the batch
+    carries on. If a worker process dies, such as when it runs out of
+    memory, the pool can't be used any more and every job not finished yet
+    is reported as failed.
+
+    Args:
+        jobs: Jobs to render
+        workers: Number of worker processes, 1 renders in this process
+
+    Yields:
+        A result per job, in completion order
+    """
+    items = list(enumerate(jobs))
+    if workers <= 1:
+        for item in items:
+            yield _run_job(item)
+        return
+
+    executor = ProcessPoolExecutor(min(workers, len(items)) or 1,
+                                   mp_context=multiprocessing.get_context('spawn'),
+                                   initializer=_init_batch_worker)
+    futures = {executor.submit(_run_job, item): item for item in items}
+    try:
+        for future in as_completed(futures):
+            try:
+                yield future.result()
+            except Exception as e:
+                # The job never reported back, typically because its worker died
+                index, job = futures[future]
+                yield BatchResult(index, job.output, error=f"{type(e).__name__}: {e}")
+    finally:
+        # Don't render the rest when the consumer stops early
+        for future in futures:
+            future.cancel()
+        executor.shutdown()
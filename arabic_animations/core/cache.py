@@ -0,0 +1,203 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Hashable, NamedTuple, Optional, Tuple
+import numpy as np
+
+logger = logging.getLogger('arabic_animations')
+
+class CacheInfo(NamedTuple):
+    """Usage statistics of an LRUCache"""
+    hits: int
+    misses: int
+    maxsize: int
+    currsize: int
+
+class LRUCache:
+    """
+    A bounded, thread-safe mapping that evicts the least recently used entry.
+
+    Args:
+        maxsize: Maximum number of entries kept. 0 disables caching.
+    """
+    def __init__(self, maxsize: int = 128):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries: 'OrderedDict[Hashable, Any]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Return the entry for key, or None on a miss"""
+        with self._lock:
+            try:
+                value = self._entries[key]
+            except KeyError:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: Hashable, value: Any) -> None:
+        """Store value under key, evicting the oldest entries if full"""
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            self._evict()
+
+    def resize(self, maxsize: int) -> None:
+        """Change the maximum number of entries"""
+        with self._lock:
+            self.maxsize = maxsize
+            self._evict()
+
+    def clear(self) -> None:
+        """Remove all entries and reset the counters"""
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def info(self) -> CacheInfo:
+        """Return hit, miss and size statistics"""
+        with self._lock:
+            return CacheInfo(self.hits, self.misses, self.maxsize, len(self._entries))
+
+    def _evict(self) -> None:
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+# Shaped Pango layouts, keyed by text and font description
+layout_cache = LRUCache(256)
+
+# Stroke data relative to the layout origin, keyed by text, font description,
+# flattening tolerance, simplification and curve mode
+path_cache = LRUCache(256)
+
+class OutlineStore:
+    """
+    Outline stroke data persisted on disk between runs.
+
+    Every entry is a directory of .npy files named after a digest of its
+    key. Entries are loaded memory mapped, so reading one copies nothing
+    until its pages are used. They are written to a temporary directory
+    and renamed into place, so processes sharing the store never see a
+    partial entry.
+
+    Args:
+        directory: Directory holding the entries, or None to disable the store
+    """
+    # Part of every key, bumped when the stored format changes
+    VERSION = 1
+
+    def __init__(self, directory: Optional[str] = None):
+        self.open(directory)
+
+    def open(self, directory: Optional[str]) -> None:
+        """Use the entries in directory, or disable the store if it is None"""
+        self.directory = Path(directory).expanduser() if directory else None
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.directory is not None
+
+    def _entry(self, key: Hashable) -> Path:
+        digest = hashlib.sha256(repr((self.VERSION, key)).encode('utf-8')).hexdigest()
+        return self.directory / digest[:2] / digest
+
+    def get(self, key: Hashable) -> Optional[Tuple[Dict[str, np.ndarray], Dict[str, Any]]]:
+        """
+        Load an entry
+
+        Returns:
+            Read-only memory mapped arrays and metadata stored under key,
+            or None if the store is disabled or holds no such entry
+        """
+        if self.directory is None:
+            return None
+        entry = self._entry(key)
+        try:
+            index = json.loads((entry / 'index.json').read_text())
+            arrays = {name: np.load(entry / f"{name}.npy", mmap_mode='r') for name in index['arrays']}
+        except (OSError, ValueError, KeyError):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return arrays, index['meta']
+
+    def put(self, key: Hashable, arrays: Dict[str, np.ndarray], meta: Optional[Dict[str, Any]] = None) -> None:
+        """Store arrays and JSON serializable metadata under key, if the store is enabled"""
+        if self.directory is None:
+            return
+        entry = self._entry(key)
+        if entry.exists():
+            return
+        try:
+            entry.parent.mkdir(parents=True, exist_ok=True)
+            staging = Path(tempfile.mkdtemp(prefix='.tmp-', dir=entry.parent))
+        except OSError as e:
+            logger.warning(f"Could not write outline cache entry: {e}")
+            return
+        try:
+            for name, array in arrays.items():
+                np.save(staging / f"{name}.npy", np.ascontiguousarray(array))
+            (staging / 'index.json').write_text(json.dumps({'arrays': list(arrays), 'meta': meta or {}}))
+            # Fails harmlessly if another process stored the entry first
+            os.rename(staging, entry)
+        except OSError:
+            shutil.rmtree(staging, ignore_errors=True)
+
+    def clear(self) -> None:
+        """Delete all entries"""
+        if self.directory is not None:
+            shutil.rmtree(self.directory, ignore_errors=True)
+
+_font_files: Dict[str, Optional[str]] = {}
+_file_digests: Dict[Tuple[str, int, int], str] = {}
+
+def font_digest(font_name: str) -> Optional[str]:
+    """
+    Return a digest of the content of the font file used for a font name
+
+    The file is resolved with fontconfig's fc-match. Returns None when it
+    cannot be resolved, in which case outlines are not stored on disk.
+    """
+    if font_name not in _font_files:
+        try:
+            result = subprocess.run(['fc-match', '--format=%{file}', font_name],
+                                    capture_output=True, text=True, check=True)
+            _font_files[font_name] = result.stdout.strip() or None
+        except (OSError, subprocess.CalledProcessError):
+            _font_files[font_name] = None
+    path = _font_files[font_name]
+    if path is None:
+        return None
+
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    key = (path, stat.st_mtime_ns, stat.st_size)
+    if key not in _file_digests:
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+        _file_digests[key] = digest.hexdigest()
+    return _file_digests[key]
+
+# Outlines kept on disk across runs, enabled by the ATA_CACHE_DIR environment variable
+outline_store = OutlineStore(os.environ.get('ATA_CACHE_DIR'))
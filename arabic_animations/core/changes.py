@@ -0,0 +1,19 @@
+"""
+A global count of changes to how drawable objects look.
+
+Colors, styles and texts bump the count whenever one of their drawn
+attributes is reassigned after construction. Caches of finished drawing
+compare it with the count they were built at, and only then check their
+objects one by one, so frames without edits pay nothing for the check.
+"""
+
+_count = 0
+
+def mark_changed() -> None:
+    """Record that an object may look different from before"""
+    global _count
+    _count += 1
+
+def change_count() -> int:
+    """Return a number that differs whenever an object changed since it was read"""
+    return _count
@@ -1,7 +1,8 @@
 from enum import Enum
-from dataclasses import dataclass, field
-from typing import Union, Tuple, Optional, List, Dict
+from dataclasses import dataclass, field, fields
+from typing import Any, Union, Tuple, Optional, List, Dict
 import colorsys
+from .changes import mark_changed
 
 class ColorFormat(Enum):
     RGB = "rgb"
@@ -20,6 +21,12 @@ class Color:
     b: float = 0.0
     a: float = 1.0
 
+    def __setattr__(self, name: str, value: Any) -> None:
+        # Drawings cached from this color must be checked again after an edit
+        if name in self.__dict__:
+            mark_changed()
+        object.__setattr__(self, name, value)
+
     @classmethod
     def from_rgb(cls, r: float, g: float, b: float, a: float = 1.0) -> 'Color':
         """Create from RGB values (0-1 range)"""
@@ -133,4 +140,55 @@ class Style:
     glow_color: Optional[Color] = None
     glow_radius: float = 0.0
     gradient: Optional[Tuple[Color, Color]] = None
-    gradient_direction: Optional[Tuple[float, float]] = None  # (x, y) vector
\ No newline at end of file
+    gradient_direction: Optional[Tuple[float, float]] = None  # (x, y) vector
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        # Drawings cached from this style must be checked again after an edit
+        if name in self.__dict__:
+            mark_changed()
+        object.__setattr__(self, name, value)
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'Style':
+        """
+        Create a style from plain values, such as parsed from JSON
+
+        Colors are hex strings, the gradient a pair of hex strings and
+        offsets and directions pairs of numbers. Missing fields keep their
+        defaults.
+        """
+        unknown = set(data) - {f.name for f in fields(cls)}
+        if unknown:
+            raise ValueError(f"Unknown style fields: {', '.join(sorted(unknown))}")
+
+        values: Dict[str, Any] = {}
+        for name, value in data.items():
+            if value is None:
+                values[name] = None
+            elif name.endswith('_color'):
+                values[name] = Color.from_hex(value)
+            elif name == 'gradient':
+                start, end = value
+                values[name] = (Color.from_hex(start), Color.from_hex(end))
+            elif name in ('shadow_offset', 'gradient_direction'):
+                x, y = value
+                values[name] = (float(x), float(y))
+            else:
+                values[name] = float(value)
+        return cls(**values)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Return the style as plain values, the inverse of from_dict"""
+        data: Dict[str, Any] = {}
+        for f in fields(self):
+            value = getattr(self, f.name)
+            if isinstance(value, Color):
+                value = value.to_hex()
+            elif f.name == 'gradient' and value is not None:
+                value = [color.to_hex() for color in value]
+            elif isinstance(value, tuple):
+                value = [float(v) for v in value]
+            elif isinstance(value, (int, float)):
+                value = float(value)
+            data[f.name] = value
+        return data
@@ -0,0 +1,119 @@
+import math
+from typing import Tuple
+import cairo
+import numpy as np
+from .layer import Layer
+
+# Number of box filter passes, three box passes approximate a gaussian
+BLUR_PASSES = 3
+
+def surface_array(surface: cairo.ImageSurface) -> np.ndarray:
+    """Return a writable (height, width) view of an A8 surface's pixels"""
+    surface.flush()
+    arr = np.ndarray(shape=(surface.get_height(), surface.get_stride()),
+                     dtype=np.uint8,
+                     buffer=surface.get_data())
+    return arr[:, :surface.get_width()]
+
+def _box_blur_axis(values: np.ndarray, radius: int, axis: int) -> np.ndarray:
+    """Average every value with its radius neighbours along axis, treating outside values as zero"""
+    size = 2 * radius + 1
+    pad = [(0, 0), (0, 0)]
+    pad[axis] = (radius + 1, radius)
+    sums = np.cumsum(np.pad(values, pad), axis=axis, dtype=np.float32)
+    if axis == 0:
+        return (sums[size:] - sums[:-size]) / size
+    return (sums[:, size:] - sums[:, :-size]) / size
+
+def box_blur(alpha: np.ndarray, radius: int) -> np.ndarray:
+    """
+    Blur a 2D array with repeated separable box filters
+
+    Args:
+        alpha: Values to blur
+        radius: Radius of each box pass in pixels
+
+    Returns:
+        Blurred float32 array of the same shape. Ink spreads at most
+        BLUR_PASSES * radius pixels.
+    """
+    blurred = alpha.astype(np.float32)
+    for axis in (0, 1):
+        for _ in range(BLUR_PASSES):
+            blurred = _box_blur_axis(blurred, radius, axis)
+    return blurred
+
+class BlurredMask:
+    """
+    A blurred alpha mask of a stroked path that can grow incrementally.
+
+    Strokes are drawn into a sharp mask, and only the area around the newly
+    drawn ink is blurred again, so extending the mask while text is being
+    written costs little and a completed mask is never blurred again.
+
+    Args:
+        extents: Scene extents (x0, y0, x1, y1) of the path points
+        line_width: Width of the strokes drawn into the mask
+        radius: Blur radius in pixels
+    """
+    def __init__(self, extents: Tuple[float, float, float, float], line_width: float, radius: float):
+        self.line_width = line_width
+        self.pass_radius = max(1, int(round(radius / BLUR_PASSES)))
+        self.spread = BLUR_PASSES * self.pass_radius
+        self.sharp = Layer.from_extents(extents, 5 * line_width + 1 + self.spread, cairo.FORMAT_A8)
+        self.blurred = cairo.ImageSurface(cairo.FORMAT_A8, self.sharp.width, self.sharp.height)
+
+    def clear(self) -> None:
+        """Erase the mask"""
+        self.sharp.clear()
+        surface_array(self.blurred)[:] = 0
+        self.blurred.mark_dirty()
+
+    def draw(self, path: cairo.Path, origin: Tuple[float, float]) -> None:
+        """
+        Stroke path into the mask and update the blur around it
+
+        Args:
+            path: Path to add, relative to origin
+            origin: Scene position of the path origin
+        """
+        ctx = self.sharp.context()
+        ctx.translate(*origin)
+        ctx.set_line_width(self.line_width)
+        ctx.append_path(path)
+        x0, y0, x1, y1 = ctx.stroke_extents()
+        ctx.stroke()
+        if x1 <= x0 or y1 <= y0:
+            return
+
+        ox, oy = origin[0] - self.sharp.x, origin[1] - self.sharp.y
+        self._blur_region(math.floor(x0 + ox), math.floor(y0 + oy),
+                          math.ceil(x1 + ox), math.ceil(y1 + oy))
+
+    def _blur_region(self, x0: int, y0: int, x1: int, y1: int) -> None:
+        """Recompute the blurred mask where ink drawn in the given pixel box spreads to"""
+        height, width = self.sharp.height, self.sharp.width
+        spread = self.spread
+
+        # Pixels the new ink can reach, and the sharp pixels that affect them
+        wx0, wy0 = max(0, x0 - spread), max(0, y0 - spread)
+        wx1, wy1 = min(width, x1 + spread), min(height, y1 + spread)
+        sx0, sy0 = max(0, wx0 - spread), max(0, wy0 - spread)
+        sx1, sy1 = min(width, wx1 + spread), min(height, wy1 + spread)
+        if wx1 <= wx0 or wy1 <= wy0:
+            return
+
+        blurred = box_blur(surface_array(self.sharp.surface)[sy0:sy1, sx0:sx1], self.pass_radius)
+        target = surface_array(self.blurred)
+        target[wy0:wy1, wx0:wx1] = np.clip(np.rint(blurred[wy0 - sy0:wy1 - sy0, wx0 - sx0:wx1 - sx0]), 0, 255)
+        self.blurred.mark_dirty()
+
+    def paint(self, ctx: cairo.Context, offset: Tuple[float, float] = (0, 0)) -> None:
+        """
+        Paint the current source of ctx through the mask
+
+        Args:
+            ctx: Context drawing in scene coordinates
+            offset: Offset of the mask from its scene position
+        """
+        ctx.mask_surface(self.blurred, self.sharp.x + offset[0], self.sharp.y + offset[1])
@@ -0,0 +1,66 @@
+import queue
+from typing import Optional
+import numpy as np
+
+class FrameBufferPool:
+    """
+    A fixed set of frame buffers reused across frames.
+
+    Buffers are handed out by acquire() and returned with release(). When
+    every buffer is in use, acquire() blocks until one is released, which
+    also limits how many frames can be in flight at once.
+
+    Args:
+        width: Frame width in pixels
+        height: Frame height in pixels
+        channels: Number of bytes per pixel, 4 for rendered frames and 3 for BGR frames
+        size: Number of buffers in the pool
+    """
+    def __init__(self, width: int, height: int, channels: int = 4, size: int = 3):
+        self.width = width
+        self.height = height
+        self.channels = channels
+        self.size = size
+        self._free: 'queue.Queue[Optional[np.ndarray]]' = queue.Queue()
+        self.closed = False
+        for _ in range(size):
+            self._free.put(np.zeros((height, width, channels), dtype=np.uint8))
+
+    def acquire(self, timeout: Optional[float] = None) -> np.ndarray:
+        """
+        Take a buffer from the pool, waiting for one to be released if needed
+
+        Args:
+            timeout: Maximum number of seconds to wait, or None to wait forever
+
+        Raises:
+            TimeoutError: If no buffer was released in time
+            RuntimeError: If the pool was closed
+        """
+        try:
+            buffer = self._free.get(timeout=timeout)
+        except queue.Empty:
+            raise TimeoutError("No frame buffer released in time") from None
+
+        if buffer is None:
+            # Leave the marker for other waiting threads
+            self._free.put(None)
+            raise RuntimeError("Frame buffer pool is closed")
+        return buffer
+
+    def release(self, buffer: np.ndarray) -> None:
+        """Return a buffer obtained from acquire() to the pool"""
+        if buffer.shape != (self.height, self.width, self.channels):
+            raise ValueError(f"Buffer of shape {buffer.shape} does not belong to this pool")
+        self._free.put(buffer)
+
+    def close(self) -> None:
+        """Wake up every thread waiting in acquire(), making it raise"""
+        if not self.closed:
+            self.closed = True
+            self._free.put(None)
+
+    @property
+    def available(self) -> int:
+        """Number of buffers currently free"""
+        return 0 if self.closed else self._free.qsize()
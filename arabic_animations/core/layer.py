@@ -0,0 +1,51 @@
+import math
+from typing import Tuple
+import cairo
+
+class Layer:
+    """
+    An offscreen surface covering a rectangle of the scene.
+
+    Drawing through the context returned by ``context()`` uses scene
+    coordinates, so paths built for the scene can be reused unchanged.
+
+    Args:
+        x: Left edge of the layer in scene coordinates
+        y: Top edge of the layer in scene coordinates
+        width: Width of the layer in pixels
+        height: Height of the layer in pixels
+        format: Cairo surface format of the layer
+    """
+    def __init__(self, x: float, y: float, width: float, height: float,
+                 format: int = cairo.FORMAT_ARGB32):
+        self.x = math.floor(x)
+        self.y = math.floor(y)
+        self.width = max(1, math.ceil(x + width) - self.x)
+        self.height = max(1, math.ceil(y + height) - self.y)
+        self.surface = cairo.ImageSurface(format, self.width, self.height)
+
+    @classmethod
+    def from_extents(cls, extents: Tuple[float, float, float, float], margin: float = 0,
+                     format: int = cairo.FORMAT_ARGB32) -> 'Layer':
+        """Create a layer covering (x0, y0, x1, y1) extents grown by margin on every side"""
+        x0, y0, x1, y1 = extents
+        return cls(x0 - margin, y0 - margin, x1 - x0 + 2 * margin, y1 - y0 + 2 * margin, format)
+
+    def context(self) -> cairo.Context:
+        """Return a context drawing onto the layer in scene coordinates"""
+        ctx = cairo.Context(self.surface)
+        ctx.translate(-self.x, -self.y)
+        return ctx
+
+    def clear(self) -> None:
+        """Erase the layer contents"""
+        ctx = cairo.Context(self.surface)
+        ctx.set_operator(cairo.OPERATOR_CLEAR)
+        ctx.paint()
+
+    def composite(self, ctx: cairo.Context) -> None:
+        """Paint the layer onto ctx at its scene position"""
+        ctx.save()
+        ctx.set_source_surface(self.surface, self.x, self.y)
+        ctx.paint()
+        ctx.restore()
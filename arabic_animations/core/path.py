@@ -0,0 +1,445 @@
+from typing import Dict, Iterable, Optional, Tuple, List
+import math
+import cairo
+import numpy as np
+
+PathElement = Tuple[int, Tuple[float, ...]]
+
+# Maximum distance between the flattened and the true outline, in output pixels
+DEFAULT_TOLERANCE = 0.25
+
+def auto_tolerance(font_size: float, scale: float = 1.0,
+                   pixel_tolerance: float = DEFAULT_TOLERANCE) -> float:
+    """
+    Derive a flattening tolerance for text from its size and the output resolution
+
+    Args:
+        font_size: Font size in points
+        scale: Output pixels per scene unit, below 1 when rendering at reduced size
+        pixel_tolerance: Acceptable deviation from the outline in output pixels
+
+    Returns:
+        Tolerance in scene units. It grows as the output shrinks, but stays
+        small enough relative to the font size to keep small text legible.
+
+    Raises:
+        ValueError: If scale is not positive
+    """
+    if scale <= 0:
+        raise ValueError(f"Scale must be positive, got {scale}")
+    return min(pixel_tolerance / scale, font_size / 200)
+
+# Number of samples in the arc-length table of a curve segment
+CURVE_SAMPLES = 16
+
+Point = Tuple[float, float]
+Bezier = Tuple[Point, Point, Point, Point]
+
+def bezier_point(curve: Bezier, t: float) -> Point:
+    """Evaluate a cubic Bézier curve at parameter t"""
+    (x0, y0), (x1, y1), (x2, y2), (x3, y3) = curve
+    u = 1 - t
+    a, b, c, d = u * u * u, 3 * u * u * t, 3 * u * t * t, t * t * t
+    return a * x0 + b * x1 + c * x2 + d * x3, a * y0 + b * y1 + c * y2 + d * y3
+
+def split_bezier(curve: Bezier, t: float) -> Tuple[Bezier, Bezier]:
+    """Split a cubic Bézier curve at parameter t with de Casteljau's algorithm"""
+    p0, p1, p2, p3 = curve
+
+    def lerp(a: Point, b: Point) -> Point:
+        return a[0] + (b[0] - a[0]) * t, a[1] + (b[1] - a[1]) * t
+
+    p01, p12, p23 = lerp(p0, p1), lerp(p1, p2), lerp(p2, p3)
+    p012, p123 = lerp(p01, p12), lerp(p12, p23)
+    mid = lerp(p012, p123)
+    return (p0, p01, p012, mid), (mid, p123, p23, p3)
+
+def bezier_segment(curve: Bezier, t0: float, t1: float) -> Bezier:
+    """Return the part of a cubic Bézier curve between parameters t0 and t1"""
+    if t1 < 1:
+        curve = split_bezier(curve, t1)[0]
+    if t0 > 0:
+        curve = split_bezier(curve, t0 / t1)[1] if t1 > 0 else (curve[0],) * 4
+    return curve
+
+def bezier_length_tables(starts: np.ndarray, controls: np.ndarray, ends: np.ndarray,
+                         samples: int = CURVE_SAMPLES) -> np.ndarray:
+    """
+    Measure cubic Bézier curves at evenly spaced parameters
+
+    Args:
+        starts: (n, 2) start points of the curves
+        controls: (n, 4) control points of the curves
+        ends: (n, 2) end points of the curves
+
+    Returns:
+        (n, samples + 1) array of the arc length from the start of each
+        curve at t = i / samples
+    """
+    t = np.linspace(0.0, 1.0, samples + 1)[None, :, None]
+    u = 1 - t
+    points = (u * u * u * starts[:, None, :] + 3 * u * u * t * controls[:, None, 0:2]
+              + 3 * u * t * t * controls[:, None, 2:4] + t * t * t * ends[:, None, :])
+    steps = np.diff(points, axis=1)
+    tables = np.zeros((len(starts), samples + 1))
+    np.cumsum(np.hypot(steps[..., 0], steps[..., 1]), axis=1, out=tables[:, 1:])
+    return tables
+
+class StrokePath:
+    """
+    A text outline grouped into strokes in drawing order.
+
+    The outline is packed into flat arrays: ``points`` holds the end point
+    of every path element, ``ops`` its cairo op code and ``offsets[j]`` the
+    index of the MOVE_TO starting stroke ``j``, with a final entry closing
+    the last stroke. Curve segments keep their control points in
+    ``controls``, one row per curve in path order.
+
+    The strokes are indexed by cumulative arc length when the path is built:
+    ``cumulative[i]`` is the length written once point ``i`` is reached and
+    ``stroke_ends[j]`` the length written once stroke ``j`` is complete, so
+    cut points are found by binary search instead of re-measuring every
+    segment on every frame. Each curve also gets an arc-length table; a
+    curve cut part way is split at the parameter interpolated from its
+    table and still appended as a curve.
+
+    A StrokePath is never modified after it is built, so it can be shared
+    between texts. It pickles as its packed arrays only.
+
+    Args:
+        points: (n, 2) end points of the path elements
+        ops: (n,) cairo op codes, MOVE_TO, LINE_TO or CURVE_TO
+        offsets: Index of the first point of every stroke, followed by n
+        controls: (m, 4) control points of the m curve segments
+        closed: Whether each stroke ended with a CLOSE_PATH
+    """
+    def __init__(self, points: np.ndarray, ops: np.ndarray, offsets: np.ndarray,
+                 controls: Optional[np.ndarray] = None, closed: Optional[np.ndarray] = None):
+        self.points = np.ascontiguousarray(points, dtype=np.float64).reshape(-1, 2)
+        self.ops = np.ascontiguousarray(ops, dtype=np.uint8)
+        self.offsets = np.ascontiguousarray(offsets, dtype=np.int64)
+        strokes = len(self.offsets) - 1
+        self.closed = (np.zeros(strokes, dtype=bool) if closed is None
+                       else np.ascontiguousarray(closed, dtype=bool))
+        self._offsets: List[int] = self.offsets.tolist()
+        count = len(self.points)
+
+        curve_indices = np.flatnonzero(self.ops == cairo.PATH_CURVE_TO)
+        if len(curve_indices):
+            self.controls: Optional[np.ndarray] = np.ascontiguousarray(controls, dtype=np.float64).reshape(-1, 4)
+            # Row in controls of the curve ending at each point, -1 for lines
+            self.curve_rows: Optional[np.ndarray] = np.full(count, -1, dtype=np.int32)
+            self.curve_rows[curve_indices] = np.arange(len(curve_indices), dtype=np.int32)
+            self.tables: Optional[np.ndarray] = bezier_length_tables(
+                self.points[curve_indices - 1], self.controls, self.points[curve_indices])
+        else:
+            self.controls = self.curve_rows = self.tables = None
+
+        steps = np.zeros(count)
+        if count > 1:
+            deltas = np.diff(self.points, axis=0)
+            steps[1:] = np.hypot(deltas[:, 0], deltas[:, 1])
+        steps[self.offsets[:-1]] = 0.0
+        if self.tables is not None:
+            steps[curve_indices] = self.tables[:, -1]
+        self.cumulative = np.cumsum(steps)
+
+        self.stroke_ends = self.cumulative[self.offsets[1:] - 1]
+        self.stroke_lengths = self.stroke_ends - self.cumulative[self.offsets[:-1]]
+        self.total_length = float(self.cumulative[-1]) if count else 0.0
+
+        if count:
+            # Control points bound their curves, so the extents cover the outline
+            bounds = self.points if self.controls is None else np.concatenate(
+                [self.points, self.controls.reshape(-1, 2)])
+            (x0, y0), (x1, y1) = bounds.min(axis=0).tolist(), bounds.max(axis=0).tolist()
+            self.extents = (x0, y0, x1, y1)
+        else:
+            self.extents = (0.0, 0.0, 0.0, 0.0)
+
+    def __reduce__(self):
+        # Lengths and tables are cheap to recompute, so only the packed outline is sent
+        return StrokePath, (self.points, self.ops, self.offsets, self.controls, self.closed)
+
+    def arrays(self) -> Dict[str, np.ndarray]:
+        """Return the packed outline, such that StrokePath(**arrays) rebuilds it"""
+        controls = self.controls if self.controls is not None else np.zeros((0, 4))
+        return {'points': self.points, 'ops': self.ops, 'offsets': self.offsets,
+                'controls': controls, 'closed': self.closed}
+
+    @classmethod
+    def from_strokes(cls, strokes: List[List[PathElement]]) -> 'StrokePath':
+        """Pack strokes given as lists of (op, coords) cairo path elements, each starting with a MOVE_TO"""
+        return cls(*_pack(element for stroke in strokes for element in stroke))
+
+    @classmethod
+    def from_cairo(cls, path: cairo.Path) -> 'StrokePath':
+        """Build a stroke path from a cairo path, with strokes sorted right to left"""
+        return cls(*_sort_right_to_left(*_pack(path)))
+
+    @property
+    def strokes(self) -> List[List[PathElement]]:
+        """The strokes as lists of (op, coords) cairo path elements, built on demand"""
+        points = self.points.tolist()
+        ops = self.ops.tolist()
+        controls = self.controls.tolist() if self.controls is not None else []
+        closed = self.closed.tolist()
+        strokes = []
+        curve = 0
+        for index in range(len(self)):
+            stroke: List[PathElement] = []
+            for i in range(self._offsets[index], self._offsets[index + 1]):
+                if ops[i] == cairo.PATH_CURVE_TO:
+                    stroke.append((ops[i], tuple(controls[curve] + points[i])))
+                    curve += 1
+                else:
+                    stroke.append((ops[i], tuple(points[i])))
+            if closed[index]:
+                stroke.append((cairo.PATH_CLOSE_PATH, ()))
+            strokes.append(stroke)
+        return strokes
+
+    @property
+    def stroke_starts(self) -> np.ndarray:
+        """Index of the first point of every stroke"""
+        return self.offsets[:-1]
+
+    @property
+    def nbytes(self) -> int:
+        """Memory held by the packed arrays, in bytes"""
+        arrays = [self.points, self.ops, self.offsets, self.closed, self.cumulative,
+                  self.stroke_ends, self.stroke_lengths, self.controls, self.curve_rows, self.tables]
+        return sum(array.nbytes for array in arrays if array is not None)
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    def complete_strokes(self, length: float) -> int:
+        """Return the number of strokes fully written at length"""
+        return int(np.searchsorted(self.stroke_ends, length, side='right'))
+
+    def stroke_range(self, index: int) -> Tuple[int, int]:
+        """Return the [start, end) point indices of a stroke"""
+        return self._offsets[index], self._offsets[index + 1]
+
+    def _find(self, length: float, start: int, end: int) -> int:
+        """Return the index of the first point in [start, end) past length, or end"""
+        return start + int(np.searchsorted(self.cumulative[start:end], length, side='right'))
+
+    def simplified(self, epsilon: float) -> 'StrokePath':
+        """
+        Remove points of flattened strokes that deviate less than epsilon from the outline
+
+        Strokes holding curves are kept as they are.
+
+        Args:
+            epsilon: Maximum deviation in scene units
+
+        Returns:
+            Simplified stroke path, in the same order
+        """
+        keep = np.ones(len(self.points), dtype=bool)
+        for index in range(len(self)):
+            start, end = self.stroke_range(index)
+            if self.curve_rows is not None and (self.curve_rows[start:end] >= 0).any():
+                continue
+            kept = simplify_polyline(self.points[start:end], epsilon)
+            keep[start:end] = False
+            keep[start + kept] = True
+
+        kept_before = np.concatenate([[0], np.cumsum(keep)])
+        return StrokePath(self.points[keep], self.ops[keep], kept_before[self.offsets],
+                          self.controls, self.closed)
+
+    def _curve(self, index: int) -> Bezier:
+        """Return the control polygon of the curve ending at point index"""
+        x1, y1, x2, y2 = self.controls[self.curve_rows[index]].tolist()
+        return tuple(self.points[index - 1].tolist()), (x1, y1), (x2, y2), tuple(self.points[index].tolist())
+
+    def _is_curve(self, index: int) -> bool:
+        return self.curve_rows is not None and self.curve_rows[index] >= 0
+
+    def _curve_parameter(self, index: int, length: float) -> float:
+        """Return the parameter of the curve ending at point index at a total length"""
+        table = self.tables[self.curve_rows[index]]
+        local = length - self.cumulative[index - 1]
+        if local <= 0:
+            return 0.0
+        if local >= table[-1]:
+            return 1.0
+        i = int(np.searchsorted(table, local, side='right')) - 1
+        return float(i + (local - table[i]) / (table[i + 1] - table[i])) / (len(table) - 1)
+
+    def point_at(self, index: int, length: float) -> Point:
+        """Interpolate the point at length on the segment ending at point index"""
+        if self._is_curve(index):
+            return bezier_point(self._curve(index), self._curve_parameter(index, length))
+        (x1, y1), (x2, y2) = self.points[index - 1:index + 1].tolist()
+        start, end = self.cumulative[index - 1:index + 1].tolist()
+        t = (length - start) / (end - start)
+        return x1 + (x2 - x1) * t, y1 + (y2 - y1) * t
+
+    def _append_points(self, ctx: cairo.Context, first: int, last: int) -> None:
+        """Append the path elements ending at points first to last - 1 to ctx"""
+        if last <= first:
+            return
+        points = self.points[first:last].tolist()
+        ops = self.ops[first:last].tolist()
+        if self.curve_rows is None:
+            for op, (x, y) in zip(ops, points):
+                if op == cairo.PATH_MOVE_TO:
+                    ctx.move_to(x, y)
+                else:
+                    ctx.line_to(x, y)
+            return
+
+        rows = self.curve_rows[first:last].tolist()
+        for op, row, (x, y) in zip(ops, rows, points):
+            if op == cairo.PATH_MOVE_TO:
+                ctx.move_to(x, y)
+            elif row < 0:
+                ctx.line_to(x, y)
+            else:
+                x1, y1, x2, y2 = self.controls[row].tolist()
+                ctx.curve_to(x1, y1, x2, y2, x, y)
+
+    def _append_segment(self, ctx: cairo.Context, index: int,
+                        start_length: float = -math.inf, end_length: float = math.inf) -> None:
+        """Append the part of the segment ending at point index between two total lengths"""
+        whole_end = end_length >= self.cumulative[index]
+        if not self._is_curve(index):
+            ctx.line_to(*(self.points[index].tolist() if whole_end else self.point_at(index, end_length)))
+            return
+        if whole_end and start_length <= self.cumulative[index - 1]:
+            self._append_points(ctx, index, index + 1)
+            return
+        _, c1, c2, end = bezier_segment(self._curve(index),
+                                        self._curve_parameter(index, start_length),
+                                        self._curve_parameter(index, end_length))
+        ctx.curve_to(*c1, *c2, *end)
+
+    def append_strokes(self, ctx: cairo.Context, first: int, last: int) -> None:
+        """Append the complete strokes first to last - 1 to the current path of ctx"""
+        self._append_points(ctx, self._offsets[first], self._offsets[last])
+
+    def append_stroke(self, ctx: cairo.Context, index: int, target_length: float = math.inf,
+                      start_length: float = -math.inf) -> None:
+        """
+        Append a stroke to the current path of ctx, cut at target_length
+
+        Args:
+            ctx: Cairo context whose path is extended
+            index: Index of the stroke in drawing order
+            target_length: Total written length at which to cut the stroke
+            start_length: Total written length from which to start the stroke
+        """
+        start, end = self.stroke_range(index)
+        cut = self._find(target_length, start, end)
+
+        if start_length > self.cumulative[start]:
+            first = self._find(start_length, start, end)
+            if first >= end:
+                return
+            ctx.move_to(*self.point_at(first, start_length))
+            # Rest of the segment the stroke starts in, up to the cut if it is there too
+            self._append_segment(ctx, first, start_length, target_length)
+            if first == cut:
+                return
+            first += 1
+        else:
+            first = start
+        self._append_points(ctx, first, cut)
+
+        if first <= cut < end and cut > start and target_length > self.cumulative[cut - 1]:
+            self._append_segment(ctx, cut, end_length=target_length)
+
+    def append_between(self, ctx: cairo.Context, start_length: float, end_length: float) -> None:
+        """Append the part of the path written between two lengths to ctx"""
+        for index in range(self.complete_strokes(start_length), len(self)):
+            if self.cumulative[self._offsets[index]] >= end_length:
+                break
+            self.append_stroke(ctx, index, end_length, start_length)
+
+PackedPath = Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray]
+
+def _pack(elements: Iterable[PathElement]) -> PackedPath:
+    """Pack cairo path elements into (points, ops, offsets, controls, closed) arrays"""
+    points: List[Tuple[float, ...]] = []
+    ops: List[int] = []
+    controls: List[Tuple[float, ...]] = []
+    starts: List[int] = []
+    closed: List[bool] = []
+    for op, coords in elements:
+        if op == cairo.PATH_CLOSE_PATH:
+            if closed:
+                closed[-1] = True
+            continue
+        if op == cairo.PATH_MOVE_TO:
+            starts.append(len(points))
+            closed.append(False)
+            points.append(coords)
+        elif op == cairo.PATH_CURVE_TO:
+            controls.append(coords[:4])
+            points.append(coords[4:])
+        else:
+            points.append(coords)
+        ops.append(op)
+    starts.append(len(points))
+    return (np.array(points, dtype=np.float64).reshape(-1, 2), np.array(ops, dtype=np.uint8),
+            np.array(starts, dtype=np.int64), np.array(controls, dtype=np.float64).reshape(-1, 4),
+            np.array(closed, dtype=bool))
+
+def _sort_right_to_left(points: np.ndarray, ops: np.ndarray, offsets: np.ndarray,
+                        controls: np.ndarray, closed: np.ndarray) -> PackedPath:
+    """Reorder packed strokes from right to left by the x-coordinate of their start"""
+    starts, sizes = offsets[:-1], np.diff(offsets)
+    order = np.argsort(-points[starts, 0], kind='stable')
+    sizes = sizes[order]
+    new_offsets = np.concatenate([[0], np.cumsum(sizes)]).astype(np.int64)
+    index = np.arange(new_offsets[-1]) + np.repeat(starts[order] - new_offsets[:-1], sizes)
+
+    is_curve = ops == cairo.PATH_CURVE_TO
+    curve_rows = np.cumsum(is_curve) - 1
+    reordered = index[is_curve[index]]
+    return points[index], ops[index], new_offsets, controls[curve_rows[reordered]], closed[order]
+
+def simplify_polyline(points: np.ndarray, epsilon: float) -> np.ndarray:
+    """
+    Simplify a polyline with the Douglas–Peucker algorithm
+
+    Args:
+        points: (n, 2) points of the polyline
+        epsilon: Maximum distance between a removed point and the simplified line
+
+    Returns:
+        Sorted indices of the points to keep, always including both ends
+    """
+    points = np.asarray(points, dtype=np.float64)
+    count = len(points)
+    if count < 3:
+        return np.arange(count)
+
+    keep = np.zeros(count, dtype=bool)
+    keep[0] = keep[-1] = True
+    ranges = [(0, count - 1)]
+    while ranges:
+        first, last = ranges.pop()
+        if last - first < 2:
+            continue
+        origin = points[first]
+        direction = points[last] - origin
+        norm = direction @ direction
+        inner = points[first + 1:last] - origin
+
+        t = np.clip(inner @ direction / norm, 0.0, 1.0) if norm else np.zeros(len(inner))
+        offsets = inner - t[:, None] * direction
+        distances = np.hypot(offsets[:, 0], offsets[:, 1])
+        farthest = int(np.argmax(distances))
+
+        if distances[farthest] > epsilon:
+            farthest += first + 1
+            keep[farthest] = True
+            ranges.append((first, farthest))
+            ranges.append((farthest, last))
+
+    return np.flatnonzero(keep)
@@ -0,0 +1,158 @@
+import collections
+import logging
+import threading
+from typing import Deque, Optional, Tuple
+import numpy as np
+from .scene import Scene
+from .framebuffer import FrameBufferPool
+
+logger = logging.getLogger('arabic_animations')
+
+class FramePrefetcher:
+    """
+    Render the frames of a looping playback ahead of time on a worker thread.
+
+    Frames are numbered by ticks that keep counting up as playback loops, so
+    tick n shows the scene at (n % loop_frames) / fps. The worker renders
+    ticks in order into a ring of frame buffers, at most size ticks ahead of
+    the playhead. When it falls behind the playhead it skips the ticks that
+    are already due, and take() drops ready frames that are older than the
+    one asked for, so playback keeps up with the clock instead of slowing down.
+
+    Frames identical to the previously rendered one are not rendered again;
+    take() returns None as their buffer, meaning the frame on screen stays.
+
+    Args:
+        scene: Scene to render. It must not be used by other threads while
+            the prefetcher runs.
+        size: Maximum number of frames rendered ahead of the playhead
+        scale: Size of the rendered frames relative to the scene size
+    """
+    def __init__(self, scene: Scene, size: int = 8, scale: float = 1.0):
+        self.scene = scene
+        self.size = size
+        self.scale = scale
+        # Frames 0 to duration * fps inclusive, as the preview always has
+        self.loop_frames = int(scene.duration * scene.fps) + 1
+        self.rendered = 0
+        self.skipped = 0
+        self.dropped = 0
+        self.error: Optional[BaseException] = None
+        # One buffer more than the ring, for the frame being rendered
+        self._pool = FrameBufferPool(*scene.frame_size(scale), 4, size=size + 1)
+        self._ready: Deque[Tuple[int, Optional[np.ndarray]]] = collections.deque()
+        self._cond = threading.Condition()
+        self._next = 0
+        self._playhead = 0
+        self._generation = 0
+        self._stopped = False
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def time_of(self, tick: int) -> float:
+        """Return the scene time shown at a tick"""
+        return (tick % self.loop_frames) / self.scene.fps
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop the worker thread and wait for it to finish its frame"""
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+        self._pool.close()
+        if self._thread.is_alive():
+            self._thread.join()
+
+    def set_playhead(self, tick: int) -> None:
+        """Tell the worker which tick is due now, letting it render up to size ticks further"""
+        with self._cond:
+            if tick > self._playhead:
+                self._playhead = tick
+                self._cond.notify_all()
+
+    def seek(self, tick: int) -> None:
+        """Jump to a tick, discarding every frame rendered ahead"""
+        with self._cond:
+            self._discard(len(self._ready))
+            self._playhead = self._next = tick
+            self._generation += 1
+            self._cond.notify_all()
+
+    def take(self, tick: int) -> Optional[Tuple[int, Optional[np.ndarray]]]:
+        """
+        Return the newest ready frame at or before tick, dropping older ones
+
+        Returns:
+            None if no frame is ready yet, otherwise the tick of the frame and
+            its buffer, or None as buffer when the frame on screen is still
+            correct. The buffer must be given back with release().
+        """
+        with self._cond:
+            entry = None
+            frame = None
+            while self._ready and self._ready[0][0] <= tick:
+                if entry is not None:
+                    self.dropped += 1
+                entry = self._ready.popleft()
+                if entry[1] is not None:
+                    # A repeat after it shows the same frame
+                    if frame is not None:
+                        self._pool.release(frame)
+                    frame = entry[1]
+            self._cond.notify_all()
+        return None if entry is None else (entry[0], frame)
+
+    def release(self, frame: np.ndarray) -> None:
+        """Give back a buffer returned by take()"""
+        self._pool.release(frame)
+
+    def _discard(self, count: int) -> None:
+        for _ in range(count):
+            _, frame = self._ready.popleft()
+            if frame is not None:
+                self._pool.release(frame)
+
+    def _run(self) -> None:
+        generation = -1
+        previous = None
+        while True:
+            with self._cond:
+                while not self._stopped and self._next >= self._playhead + self.size:
+                    self._cond.wait()
+                if self._stopped:
+                    return
+                if self._generation != generation:
+                    generation = self._generation
+                    previous = None
+                if self._next < self._playhead:
+                    # Fallen behind the clock: go straight to the frame due now
+                    self.skipped += self._playhead - self._next
+                    self._next = self._playhead
+                tick = self._next
+
+            t = self.time_of(tick)
+            try:
+                key = self.scene.frame_key(t)
+                frame = None
+                if key is None or key != previous:
+                    try:
+                        buffer = self._pool.acquire()
+                    except RuntimeError:
+                        # The pool was closed by stop()
+                        return
+                    frame = self.scene.render_frame(t, buffer, self.scale)
+                    self.rendered += 1
+                previous = key
+            except Exception as e:
+                logger.error(f"Error rendering frame at t={t:.3f}: {e}")
+                self.error = e
+                return
+
+            with self._cond:
+                if generation != self._generation or self._stopped:
+                    if frame is not None:
+                        self._pool.release(frame)
+                    continue
+                self._ready.append((tick, frame))
+                self._next = tick + 1
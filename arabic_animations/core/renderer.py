@@ -0,0 +1,351 @@
+import multiprocessing
+import multiprocessing.pool
+import queue
+import threading
+import time
+import logging
+from dataclasses import dataclass
+from typing import Iterator, Iterable, List, Dict, Optional, Any, Callable, Sequence, Tuple
+import cv2
+import numpy as np
+from .scene import Scene
+from .framebuffer import FrameBufferPool
+from ..utils.loader import load_scene
+from ..utils.profiling import profiler
+
+logger = logging.getLogger('arabic_animations')
+
+# Scene built by each worker process from the script, and the buffer it renders into
+_worker_scene: Optional[Scene] = None
+_worker_buffer: Optional[np.ndarray] = None
+# Why the scene could not be built, raised again by the tasks of the worker
+_worker_error: Optional[Exception] = None
+
+# Default limit on the memory held by rendered chunks waiting to be yielded
+DEFAULT_MEMORY_LIMIT = 1 << 30
+
+def to_bgr(frame: np.ndarray, dst: Optional[np.ndarray] = None) -> np.ndarray:
+    """Convert a rendered BGRA frame to the BGR layout cv2.VideoWriter expects"""
+    return cv2.cvtColor(frame, cv2.COLOR_BGRA2BGR, dst=dst)
+
+def render_frames(scene: Scene, start: int, end: int,
+                  pool: Optional[FrameBufferPool] = None,
+                  skip_repeats: bool = False) -> Iterator[Optional[np.ndarray]]:
+    """
+    Render frames one after another in this process
+
+    Args:
+        scene: Scene to render
+        start: Index of the first frame
+        end: Index one past the last frame
+        pool: Optional pool to render into. The consumer must release every
+            frame back to the pool.
+        skip_repeats: If True, yield None instead of rendering a frame that
+            Scene.frame_key shows to be identical to the previous one. The
+            first frame is always rendered.
+
+    Yields:
+        Frames as returned by Scene.render_frame, or None for repeats
+    """
+    previous = None
+    for index in range(start, end):
+        t = index / scene.fps
+        if skip_repeats:
+            key = scene.frame_key(t)
+            if key is not None and key == previous:
+                yield None
+                continue
+            previous = key
+        yield scene.render_frame(t, pool.acquire() if pool else None)
+
+def _init_worker(script_path: str) -> None:
+    """
+    Build the scene once per worker process
+
+    A pool replaces workers whose initializer raises, forever, so a script
+    that fails to load is only recorded here and reported by every task.
+    """
+    global _worker_scene, _worker_error
+    logger.setLevel(logging.WARNING)
+    try:
+        _worker_scene = load_scene(script_path)
+        if _worker_scene is None:
+            raise ValueError("Script must define a 'scene' object")
+    except Exception as e:
+        _worker_error = e
+
+def _get_worker_scene() -> Scene:
+    """Return the scene of this worker, raising the error that kept it from being built"""
+    if _worker_error is not None:
+        raise _worker_error
+    return _worker_scene
+
+def _frame_bytes() -> int:
+    """Return the size in bytes of a BGR frame of the worker's scene"""
+    width, height = _get_worker_scene().frame_size()
+    return width * height * 3
+
+def _render_chunk(start: int, end: int) -> List[np.ndarray]:
+    """
+    Render a contiguous range of frames in a worker process
+
+    Repeated frames are the same array as the frame before them, which
+    pickle sends back only once.
+    """
+    chunk: List[np.ndarray] = []
+    for frame in render_frames(_get_worker_scene(), start, end, skip_repeats=True):
+        chunk.append(chunk[-1] if frame is None else to_bgr(frame))
+    return chunk
+
+def render_frames_parallel(script_path: str, start: int, end: int, workers: int,
+                           chunk_size: int = 8,
+                           memory_limit: int = DEFAULT_MEMORY_LIMIT) -> Iterator[np.ndarray]:
+    """
+    Render frames on a pool of worker processes and yield them in order
+
+    Each worker builds the scene once from the script and renders contiguous
+    chunks of frames, so incremental rendering stays effective within a chunk.
+    Finished chunks wait in a reorder buffer until every earlier frame has
+    been yielded. New chunks are only submitted while the chunks in flight
+    and waiting fit in memory_limit, counting every frame at full size, up
+    to two per worker. Chunks are shortened when one would not fit on its
+    own, down to a single frame.
+
+    Args:
+        script_path: Path to the scene script
+        start: Index of the first frame
+        end: Index one past the last frame
+        workers: Number of worker processes
+        chunk_size: Number of consecutive frames per task
+        memory_limit: Bytes of rendered frames the reorder buffer may hold
+
+    Yields:
+        Frames in BGR format, ready for cv2.VideoWriter
+    """
+    context = multiprocessing.get_context('spawn')
+
+    with context.Pool(workers, initializer=_init_worker, initargs=(script_path,)) as pool:
+        frame_bytes = pool.apply(_frame_bytes)
+        chunk_size = max(1, min(chunk_size, memory_limit // frame_bytes))
+        window = max(1, min(workers * 2, memory_limit // (chunk_size * frame_bytes)))
+        if window < workers:
+            logger.info(f"Only {window} of {workers} workers are kept busy within the memory limit "
+                        f"of {memory_limit // (1 << 20)} MiB")
+        chunks = [(first, min(first + chunk_size, end))
+                  for first in range(start, end, chunk_size)]
+
+        pending: Dict[int, multiprocessing.pool.AsyncResult] = {}
+        submitted = 0
+        for index in range(len(chunks)):
+            while submitted < len(chunks) and submitted < index + window:
+                pending[submitted] = pool.apply_async(_render_chunk, chunks[submitted])
+                submitted += 1
+            yield from pending.pop(index).get()
+
+@dataclass
+class StageStats:
+    """Throughput of a single pipeline stage"""
+    name: str
+    frames: int = 0
+    seconds: float = 0.0
+
+    @property
+    def fps(self) -> float:
+        """Frames processed per second of time spent in the stage"""
+        return self.frames / self.seconds if self.seconds else 0.0
+
+# Marks the end of the frame stream in pipeline queues
+_END = object()
+
+class FramePipeline:
+    """
+    Run frame production and processing stages concurrently.
+
+    The source and every stage run on their own thread, connected by bounded
+    queues. A stage that falls behind blocks the ones feeding it, so at most
+    queue_size frames wait between any two stages. Cairo and OpenCV release
+    the GIL while drawing, converting and encoding, so the stages overlap.
+
+    Iterating the pipeline yields the output of the last stage, in order.
+
+    Args:
+        source: Iterable producing frames
+        stages: (name, function) pairs applied to each frame in turn
+        source_name: Name reported for the source stage
+        queue_size: Maximum number of frames waiting between two stages
+        pools: Frame buffer pools used by the stages. They are closed when
+            the pipeline stops, so stages waiting for a buffer wake up.
+    """
+    def __init__(self,
+                 source: Iterable[Any],
+                 stages: Sequence[Tuple[str, Callable[[Any], Any]]],
+                 source_name: str = 'render',
+                 queue_size: int = 4,
+                 pools: Sequence[FrameBufferPool] = ()):
+        self.source = source
+        self.stages = list(stages)
+        self.queue_size = queue_size
+        self.pools = list(pools)
+        self.stats = [StageStats(source_name)] + [StageStats(name) for name, _ in self.stages]
+        self._stop = threading.Event()
+        self._error: Optional[BaseException] = None
+
+    def _put(self, q: queue.Queue, item: Any) -> bool:
+        """Put item on q, giving up if the pipeline is stopping"""
+        while not self._stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _get(self, q: queue.Queue) -> Any:
+        """Take the next item from q, or _END if the pipeline is stopping"""
+        while not self._stop.is_set():
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        return _END
+
+    def _fail(self, error: BaseException) -> None:
+        """Record the first error raised by a stage and stop every thread"""
+        if self._error is None:
+            self._error = error
+        self._stop.set()
+
+    def _run_source(self, out: queue.Queue) -> None:
+        stats = self.stats[0]
+        try:
+            frames = iter(self.source)
+            while True:
+                start = time.perf_counter()
+                try:
+                    frame = next(frames)
+                except StopIteration:
+                    break
+                stats.seconds += time.perf_counter() - start
+                stats.frames += 1
+                if not self._put(out, frame):
+                    return
+            self._put(out, _END)
+        except BaseException as e:
+            self._fail(e)
+
+    def _run_stage(self, index: int, inp: queue.Queue, out: queue.Queue) -> None:
+        _, function = self.stages[index]
+        stats = self.stats[index + 1]
+        try:
+            while True:
+                item = self._get(inp)
+                if item is _END:
+                    break
+                start = time.perf_counter()
+                result = function(item)
+                stats.seconds += time.perf_counter() - start
+                stats.frames += 1
+                if not self._put(out, result):
+                    return
+            self._put(out, _END)
+        except BaseException as e:
+            self._fail(e)
+
+    def __iter__(self) -> Iterator[Any]:
+        queues = [queue.Queue(maxsize=self.queue_size) for _ in range(len(self.stages) + 1)]
+        threads = [threading.Thread(target=self._run_source, args=(queues[0],), daemon=True)]
+        for index in range(len(self.stages)):
+            threads.append(threading.Thread(target=self._run_stage,
+                                            args=(index, queues[index], queues[index + 1]),
+                                            daemon=True))
+        for thread in threads:
+            thread.start()
+
+        try:
+            while True:
+                item = self._get(queues[-1])
+                if item is _END:
+                    break
+                yield item
+        finally:
+            self._stop.set()
+            for pool in self.pools:
+                pool.close()
+            for thread in threads:
+                thread.join()
+
+        if self._error is not None:
+            raise self._error
+
+def video_pipeline(scene: Scene, writer: cv2.VideoWriter, start: int, end: int,
+                   queue_size: int = 4) -> FramePipeline:
+    """
+    Build a pipeline rendering frames [start, end) of scene into writer
+
+    Frames are rendered, converted to BGR and encoded on separate threads.
+    Both stages reuse buffers from fixed pools, so no frame-sized memory is
+    allocated per frame and a full pool holds back the stages feeding it.
+    Frames identical to the previous one are neither rendered nor converted:
+    the encoder writes the last converted frame again.
+
+    Args:
+        scene: Scene to render
+        writer: Open video writer receiving BGR frames
+        start: Index of the first frame
+        end: Index one past the last frame
+        queue_size: Maximum number of frames waiting between two stages
+    """
+    # Enough buffers for a full queue plus one frame inside each stage, and
+    # the last converted frame kept by the encoder for repeats
+    frames = FrameBufferPool(scene.width, scene.height, 4, size=queue_size + 2)
+    converted = FrameBufferPool(scene.width, scene.height, 3, size=queue_size + 3)
+    last: List[np.ndarray] = []
+
+    def convert(frame: Optional[np.ndarray]) -> Optional[np.ndarray]:
+        if frame is None:
+            return None
+        bgr = converted.acquire()
+        with profiler.stage('cvtColor'):
+            to_bgr(frame, bgr)
+        frames.release(frame)
+        return bgr
+
+    def encode(bgr: Optional[np.ndarray]) -> None:
+        if bgr is None:
+            bgr = last[0]
+        else:
+            if last:
+                converted.release(last.pop())
+            last.append(bgr)
+        with profiler.stage('VideoWriter.write'):
+            writer.write(bgr)
+
+    return FramePipeline(render_frames(scene, start, end, frames, skip_repeats=True),
+                         [('convert', convert), ('encode', encode)],
+                         queue_size=queue_size,
+                         pools=[frames, converted])
+
+def parallel_video_pipeline(script_path: str, writer: cv2.VideoWriter, start: int, end: int,
+                            workers: int, queue_size: int = 4,
+                            memory_limit: int = DEFAULT_MEMORY_LIMIT) -> FramePipeline:
+    """
+    Build a pipeline rendering the scene of a script on worker processes into writer
+
+    Args:
+        script_path: Path to the scene script
+        writer: Open video writer receiving BGR frames
+        start: Index of the first frame
+        end: Index one past the last frame
+        workers: Number of worker processes
+        queue_size: Maximum number of frames waiting to be encoded
+        memory_limit: Bytes of rendered frames waiting to be put in order
+    """
+    def encode(bgr: np.ndarray) -> None:
+        with profiler.stage('VideoWriter.write'):
+            writer.write(bgr)
+
+    # Workers return frames already converted to BGR
+    return FramePipeline(render_frames_parallel(script_path, start, end, workers,
+                                                memory_limit=memory_limit),
+                         [('encode', encode)],
+                         queue_size=queue_size)
@@ -1,11 +1,34 @@
 import cairo
 import gi
-from typing import List, Any, Optional
+from dataclasses import dataclass
+from typing import Dict, List, Any, Optional, Tuple
 gi.require_version('Pango', '1.0')
 gi.require_version('PangoCairo', '1.0')
 from gi.repository import Pango, PangoCairo
 import numpy as np
+from .changes import change_count
 from .color import Colors, Color
+from .layer import Layer
+from .path import DEFAULT_TOLERANCE
+from .timeline import Timeline
+from ..utils.profiling import profiler
+
+@dataclass
+class FinishedRun:
+    """
+    A layer with the finished objects of a run of draw indices
+
+    Runs lie between the objects still being written, and start at draw
+    index start. The layer holds the objects finished from start up to
+    end, and the run of draw index 0 also holds the background.
+    """
+    layer: Layer
+    end: int
+    # (draw index, render key) of every object drawn into the layer
+    drawn: List[Tuple[int, Any]]
+    # False until the drawn objects were checked against the timeline,
+    # for runs taken over from a previous version of the scene
+    verified: bool = True
 
 class Scene:
     """
@@ -15,69 +38,273 @@ class Scene:
         width: Width of the scene in pixels
         height: Height of the scene in pixels
         fps: Frames per second for the animation
+        incremental: If True, objects that support it only draw the ink added
+            since the previous frame onto persistent layers instead of being
+            redrawn from the start. Rendering backwards redraws from scratch.
+        tolerance: Maximum deviation of flattened text outlines from the true
+            outlines, in output pixels. Texts without their own tolerance
+            derive theirs from it and their font size.
     """
-    def __init__(self, width: int = 1920, height: int = 1080, fps: int = 60):
+    def __init__(self, width: int = 1920, height: int = 1080, fps: int = 60,
+                 incremental: bool = False, tolerance: float = DEFAULT_TOLERANCE):
         self.width = width
         self.height = height
         self.fps = fps
+        self.incremental = incremental
+        self.tolerance = tolerance
         self.duration = 0
-        self.objects: List[Any] = []
+        self.timeline = Timeline()
         self.serial = False
         self.background_color: Color = Colors.PAPER_WHITE
+        # Cached runs of finished objects by their first draw index
+        self._runs: Dict[int, FinishedRun] = {}
+        self._runs_header: Optional[Tuple] = None
+        self._runs_changes = 0
+
+    @property
+    def objects(self) -> List[Any]:
+        """The objects of the scene in draw order"""
+        return self.timeline.objects
 
-    def add(self, *objects: Any, serial: bool = False) -> None:
+    def add(self, *objects: Any, serial: bool = False, start: float = 0.0, layer: int = 0) -> None:
         """
         Add objects to the scene.
 
         Args:
             *objects: One or more objects to add to the scene
             serial: If True, objects will animate one after another. If False, they animate simultaneously.
+            start: Time in seconds the first object starts animating, so
+                groups added separately can be placed on the timeline
+            layer: Objects on higher layers are drawn over lower ones.
+                Within a layer, objects added later are drawn on top.
         """
         self.serial = serial
-        current_delay = 0
+        current_delay = start
 
         for obj in objects:
             if hasattr(obj, 'set_scene_dimensions'):
                 obj.set_scene_dimensions(self.width, self.height)
+            if hasattr(obj, 'set_level_of_detail'):
+                obj.set_level_of_detail(self.tolerance)
 
+            self.timeline.add(obj, current_delay, layer)
             if serial:
-                obj.start_time = current_delay
                 current_delay += obj.duration
+
+        self.duration = self.timeline.duration
+
+    def set_level_of_detail(self, scale: float = 1.0, tolerance: Optional[float] = None) -> None:
+        """
+        Adapt the outlines of every object to rendering at a different resolution
+
+        Args:
+            scale: Size of the rendered frames relative to the scene size
+            tolerance: Maximum deviation of the outlines in rendered pixels,
+                the scene's tolerance by default
+        """
+        for obj in self.objects:
+            if hasattr(obj, 'set_level_of_detail'):
+                obj.set_level_of_detail(self.tolerance if tolerance is None else tolerance, scale)
+
+    def reuse_state(self, previous: 'Scene') -> None:
+        """
+        Take over the drawing state of a previous version of this scene
+
+        Objects are matched by their construction parameters, in order, so a
+        script reloaded after an edit keeps the cached layers of the texts it
+        did not change. The previous scene must not be rendered afterwards.
+        """
+        unmatched: Dict[Tuple, List[Any]] = {}
+        for obj in previous.objects:
+            if hasattr(obj, 'geometry_key'):
+                unmatched.setdefault((type(obj), obj.geometry_key()), []).append(obj)
+        for obj in self.objects:
+            if hasattr(obj, 'geometry_key'):
+                candidates = unmatched.get((type(obj), obj.geometry_key()))
+                if candidates:
+                    obj.reuse_state(candidates.pop(0))
+
+        header = previous._runs_header
+        if header is not None and header[:-1] == self._runs_header_for(header[2])[:-1]:
+            # Keep the runs holding what this scene would draw into them.
+            # Which objects are finished is checked when a run is first used.
+            objects = self.objects
+            for start, run in previous._runs.items():
+                if all(index < len(objects) and objects[index].render_key() == key
+                       for index, key in run.drawn):
+                    self._runs[start] = FinishedRun(run.layer, run.end, list(run.drawn), verified=False)
+            # The layers now belong to this scene
+            previous._runs = {}
+            self._runs_header = self._runs_header_for(header[2])
+            self._runs_changes = change_count()
+
+    def frame_size(self, scale: float = 1.0) -> Tuple[int, int]:
+        """Return the width and height in pixels of frames rendered at scale"""
+        return max(1, round(self.width * scale)), max(1, round(self.height * scale))
+
+    def _runs_header_for(self, scale: float) -> Tuple:
+        """Return what every cached run depends on at a rendering scale"""
+        return self.width, self.height, scale, self.background_color.to_rgb(), self.timeline.version
+
+    def _check_runs(self, scale: float) -> None:
+        """Drop the cached runs that no longer hold what the scene would draw"""
+        header = self._runs_header_for(scale)
+        if header != self._runs_header:
+            self._runs = {}
+            self._runs_header = header
+        changes = change_count()
+        if changes != self._runs_changes:
+            # Something was edited; keep the runs whose objects look the same
+            objects = self.objects
+            self._runs = {start: run for start, run in self._runs.items()
+                          if all(objects[index].render_key() == key for index, key in run.drawn)}
+            self._runs_changes = changes
+
+    def _run_layer(self, start: int, end: int, t: float, scale: float) -> Optional[Layer]:
+        """
+        Return a layer with the objects finished at time t with draw indices in [start, end)
+
+        The cached run starting at start is reused when it holds the same
+        finished objects up to its own end, and then only the objects
+        finished after that end are drawn onto it. Otherwise the run is
+        drawn again. Returns None for a run other than the first that has
+        nothing to draw.
+        """
+        timeline = self.timeline
+        run = self._runs.get(start)
+        if run is not None and (run.end > end or timeline.finished_count(start, run.end, t) != len(run.drawn)):
+            run = None
+        if run is not None and not run.verified:
+            if list(timeline.finished(start, run.end, t)) != [index for index, _ in run.drawn]:
+                run = None
             else:
-                obj.start_time = 0
+                run.verified = True
+
+        if run is None:
+            if start > 0 and timeline.finished_count(start, end, t) == 0:
+                self._runs.pop(start, None)
+                return None
+            run = FinishedRun(Layer(0, 0, *self.frame_size(scale)), start, [])
+            if start == 0:
+                ctx = run.layer.context()
+                ctx.set_source_rgba(*self.background_color.to_rgb())
+                ctx.paint()
+            self._runs[start] = run
+
+        if run.end < end:
+            ctx = run.layer.context()
+            ctx.scale(scale, scale)
+            objects = self.objects
+            for index in timeline.finished(run.end, end, t):
+                obj = objects[index]
+                if hasattr(obj, 'render'):
+                    obj.render(ctx, obj.duration)
+                run.drawn.append((index, obj.render_key()))
+            run.end = end
+        return run.layer
 
-            self.objects.append(obj)
+    def frame_key(self, t: float) -> Optional[Tuple]:
+        """
+        Return a key describing everything drawn in the frame at time t
+
+        Frames with equal keys are identical. The key holds the scene size
+        and background, the number of edits to colors, styles and texts so
+        far, how many objects have started and finished, which determines
+        which ones, and the render key and state at t of every object still
+        being written. Returns None when such an object cannot describe its
+        state, so no frame is known to repeat.
+        """
+        timeline = self.timeline
+        key: List[Any] = [(self.width, self.height, self.background_color.to_rgb(), timeline.version),
+                          change_count(), timeline.started_count(t),
+                          timeline.finished_count(0, len(timeline), t)]
+        objects = self.objects
+        for index in timeline.active(t):
+            obj = objects[index]
+            if not hasattr(obj, 'render'):
+                continue
+            if not hasattr(obj, 'render_key') or not hasattr(obj, 'frame_state'):
+                return None
+            key.append((obj.render_key(), obj.frame_state(min(t - obj.start_time, obj.duration))))
+        return tuple(key)
 
-        self.duration = current_delay if serial else max(obj.duration for obj in objects)
+    def is_repeat(self, t: float, previous: float) -> bool:
+        """Return whether the frame at time t is identical to the frame at time previous"""
+        key = self.frame_key(t)
+        return key is not None and key == self.frame_key(previous)
 
-    def render_frame(self, t: float) -> np.ndarray:
+    def render_frame(self, t: float, out: Optional[np.ndarray] = None,
+                     scale: float = 1.0) -> np.ndarray:
         """
         Render a single frame at time t.
 
+        Only the objects still being written are drawn. The finished objects
+        between them in draw order are drawn once into cached layers, one
+        per run between two objects being written, which later frames copy
+        and extend as more objects finish.
+
         Args:
             t: Time in seconds
+            out: Optional (height, width, 4) uint8 array to render into, such
+                as a buffer from a FrameBufferPool. A new array is allocated
+                when omitted.
+            scale: Size of the frame relative to the scene size, as given by
+                frame_size. The scene is drawn scaled, so a small preview
+                costs less than rendering full size and scaling it down.
 
         Returns:
-            A numpy array representing the frame in RGBA format
+            A numpy array representing the frame in cairo's ARGB32 layout,
+            which is BGRA in memory on little-endian machines. This is out
+            when it was given.
         """
-        surface = cairo.ImageSurface(cairo.FORMAT_ARGB32, self.width, self.height)
+        width, height = self.frame_size(scale)
+        if out is None:
+            out = np.empty((height, width, 4), dtype=np.uint8)
+        elif out.shape != (height, width, 4) or out.dtype != np.uint8 or not out.flags.c_contiguous:
+            raise ValueError(f"Frame buffer must be a contiguous uint8 array of shape "
+                             f"{(height, width, 4)}")
+
+        surface = cairo.ImageSurface.create_for_data(out, cairo.FORMAT_ARGB32,
+                                                     width, height, width * 4)
         ctx = cairo.Context(surface)
 
-        # Clear background with specified color
-        ctx.set_source_rgba(*self.background_color.to_rgb())
-        ctx.paint()
+        with profiler.stage('scene.frame'):
+            self._check_runs(scale)
+            active = self.timeline.active(t)
+            starts = [0] + [index + 1 for index in active]
+            ends = active + [len(self.timeline)]
+            objects = self.objects
 
-        # Render all objects
-        for obj in self.objects:
-            if hasattr(obj, 'render'):
-                if t >= obj.start_time and t <= obj.start_time + obj.duration:
-                    obj.render(ctx, t - obj.start_time)
-                elif t > obj.start_time + obj.duration:
-                    obj.render(ctx, obj.duration)
+            for number, (start, end) in enumerate(zip(starts, ends)):
+                if number > 0:
+                    # Render an object still being written
+                    obj = objects[start - 1]
+                    if hasattr(obj, 'render'):
+                        local_t = min(t - obj.start_time, obj.duration)
+                        if self.incremental and getattr(obj, 'supports_incremental', False):
+                            with profiler.stage('text.incremental', obj):
+                                obj.render_incremental(ctx, local_t)
+                        else:
+                            obj.render(ctx, local_t)
+
+                # Copy the finished objects up to the next one, the first
+                # run replacing the whole frame with the background
+                with profiler.stage('scene.static'):
+                    layer = self._run_layer(start, end, t, scale)
+                    if layer is not None:
+                        ctx.save()
+                        ctx.identity_matrix()
+                        ctx.set_source_surface(layer.surface)
+                        if number == 0:
+                            ctx.set_operator(cairo.OPERATOR_SOURCE)
+                        ctx.paint()
+                        ctx.restore()
+                if number == 0:
+                    ctx.scale(scale, scale)
+
+            # Forget runs that start at an object no longer being written
+            for start in set(self._runs) - set(starts):
+                del self._runs[start]
 
-        # Convert to numpy array
-        data = surface.get_data()
-        arr = np.ndarray(shape=(self.height, self.width, 4),
-                        dtype=np.uint8,
-                        buffer=data)
-        return arr
\ No newline at end of file
+            surface.flush()
+        return out
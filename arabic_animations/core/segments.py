@@ -0,0 +1,136 @@
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import List, Optional, Sequence, Tuple
+
+@dataclass
+class SegmentInfo:
+    """
+    Description of a rendered segment, stored next to its video file
+
+    Args:
+        script: Digest of the script the segment was rendered from
+        start: Index of the first frame
+        end: Index one past the last frame
+        fps: Frames per second
+        width: Width of the video in pixels
+        height: Height of the video in pixels
+    """
+    script: str
+    start: int
+    end: int
+    fps: int
+    width: int
+    height: int
+
+def chunk_range(total_frames: int, index: int, count: int) -> Tuple[int, int]:
+    """
+    Return the frames [start, end) of chunk index of count equal chunks
+
+    Chunks are numbered from 1, so chunk 1/4 is the first quarter.
+    """
+    if count < 1 or not 1 <= index <= count:
+        raise ValueError(f"Chunk {index}/{count} is out of range, chunks are numbered from 1 to {max(count, 1)}")
+    return total_frames * (index - 1) // count, total_frames * index // count
+
+def parse_chunk(value: str) -> Tuple[int, int]:
+    """Parse a chunk written as 'i/N'"""
+    try:
+        index, count = (int(part) for part in value.split('/'))
+    except ValueError:
+        raise ValueError(f"Chunk must be written as i/N, got {value!r}")
+    chunk_range(0, index, count)
+    return index, count
+
+def script_digest(path: str) -> str:
+    """Return a digest of the content of a script or scene file"""
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+def partial_path(output: str) -> str:
+    """Return the path a video is written to before it is complete"""
+    path = Path(output)
+    # Keep the extension, from which the writer picks the container
+    return str(path.with_name(f".{path.stem}.partial{path.suffix}"))
+
+def info_path(output: str) -> str:
+    """Return the path of the description of a segment"""
+    return output + '.json'
+
+def write_segment_info(output: str, info: SegmentInfo) -> None:
+    with open(info_path(output), 'w') as f:
+        json.dump(asdict(info), f)
+
+def read_segment_info(output: str) -> Optional[SegmentInfo]:
+    """Return the description of a segment, or None if it has none"""
+    try:
+        with open(info_path(output)) as f:
+            return SegmentInfo(**json.load(f))
+    except (OSError, ValueError, TypeError):
+        return None
+
+def is_complete(output: str, info: SegmentInfo) -> bool:
+    """
+    Return whether output already holds the segment described by info
+
+    Videos are only moved to their output path once fully written, so a
+    segment is complete when its file exists and it was rendered from the
+    same script with the same frames and format.
+    """
+    return os.path.exists(output) and read_segment_info(output) == info
+
+def merge_segments(segments: Sequence[str], output: str) -> None:
+    """
+    Concatenate segment videos into one without re-encoding them
+
+    Segments are joined with ffmpeg's concat demuxer. When every segment has
+    a description they are put in frame order and must follow each other
+    without gaps or overlaps, and share the same script and format.
+
+    Args:
+        segments: Paths of the segment videos
+        output: Path of the merged video
+
+    Raises:
+        ValueError: If the segments do not form a contiguous range of frames
+        RuntimeError: If ffmpeg is not installed or fails
+    """
+    ffmpeg = shutil.which('ffmpeg')
+    if ffmpeg is None:
+        raise RuntimeError("Merging segments requires ffmpeg on the PATH")
+
+    infos = [read_segment_info(segment) for segment in segments]
+    paths: List[str] = list(segments)
+    if all(infos):
+        order = sorted(range(len(paths)), key=lambda i: infos[i].start)
+        paths = [paths[i] for i in order]
+        infos = [infos[i] for i in order]
+        for previous, info, path in zip(infos, infos[1:], paths[1:]):
+            if (info.script, info.fps, info.width, info.height) != \
+                    (previous.script, previous.fps, previous.width, previous.height):
+                raise ValueError(f"{path} was rendered from a different script or format")
+            if info.start != previous.end:
+                raise ValueError(f"{path} starts at frame {info.start}, expected {previous.end}")
+
+    with tempfile.NamedTemporaryFile('w', suffix='.txt', delete=False) as listing:
+        for path in paths:
+            escaped = os.path.abspath(path).replace("'", "'\\''")
+            listing.write(f"file '{escaped}'\n")
+    partial = partial_path(output)
+    try:
+        result = subprocess.run([ffmpeg, '-hide_banner', '-loglevel', 'error', '-y',
+                                 '-f', 'concat', '-safe', '0', '-i', listing.name,
+                                 '-c', 'copy', partial],
+                                capture_output=True, text=True)
+        if result.returncode != 0:
+            raise RuntimeError(f"ffmpeg failed: {result.stderr.strip()}")
+        os.replace(partial, output)
+    finally:
+        os.unlink(listing.name)
+        if os.path.exists(partial):
+            os.unlink(partial)
@@ -1,17 +1,37 @@
-from typing import Tuple, Optional, List
+from typing import Tuple, Optional, List, Dict
+from dataclasses import dataclass, astuple
 import cairo
 import gi
 gi.require_version('Pango', '1.0')
 gi.require_version('PangoCairo', '1.0')
 from gi.repository import Pango, PangoCairo
-import math
 import traceback
 import logging
 from .position import Position, Padding, calculate_position
+from .changes import mark_changed
 from .color import Color, Colors, Style
+from .layer import Layer
+from .path import StrokePath, auto_tolerance, DEFAULT_TOLERANCE
+from .cache import layout_cache, path_cache, outline_store, font_digest
+from .effects import BlurredMask
+from ..utils.profiling import profiler
 
 logger = logging.getLogger('arabic_animations')
 
+@dataclass
+class RenderPass:
+    """
+    A single stroke or fill pass over the written path
+
+    Passes with a blur are painted through a blurred mask of the strokes
+    instead of stroking the path directly.
+    """
+    color: Color
+    line_width: float
+    offset: Tuple[float, float] = (0, 0)
+    fill: bool = False
+    blur: float = 0.0
+
 class Text:
     """
     A text object that can be animated.
@@ -24,6 +44,16 @@ class Text:
         font_size: Size of the font in points
         style: Style object for visual appearance
         write_duration: Duration of the writing animation in seconds
+        tolerance: Maximum deviation of the flattened outline from the glyph
+            outlines, in scene units. Derived from the font size and the
+            scene's level of detail when omitted.
+        simplify: Whether to drop outline points that deviate less than the
+            tolerance from the outline. Fewer points make long texts faster
+            to draw, at the cost of twice the deviation from the glyphs.
+        curves: Whether to keep the curves of the glyph outlines instead of
+            flattening them into line segments. Curved outlines need far
+            fewer path operations per frame and are cut exactly, and they
+            do not depend on the tolerance.
     """
     def __init__(self,
                  text: str,
@@ -32,7 +62,10 @@ class Text:
                  font_name: str = "DecoType Thuluth",
                  font_size: int = 72,
                  style: Optional[Style] = None,
-                 write_duration: float = 1.0):
+                 write_duration: float = 1.0,
+                 tolerance: Optional[float] = None,
+                 simplify: bool = False,
+                 curves: bool = False):
         self.text = text
         self.position_type = position if isinstance(position, Position) else Position.CENTER
         self.padding = padding if padding else Padding()
@@ -40,194 +73,486 @@ class Text:
         self.font_size = font_size
         self.style = style if style else Style()
         self.duration = write_duration
+        self.tolerance = tolerance
+        self.simplify = simplify
+        self.curves = curves
+        self._pixel_tolerance = DEFAULT_TOLERANCE
+        self._scale = 1.0
         self._position: Tuple[float, float] = (0, 0)
         self._init_path()
 
+    def __setattr__(self, name: str, value) -> None:
+        # The attributes in render_key; drawings cached from this text must
+        # be checked again when they are replaced
+        if name in ('style', '_position', '_stroke_path') and name in self.__dict__:
+            mark_changed()
+        object.__setattr__(self, name, value)
+
+    def __getstate__(self) -> dict:
+        """
+        Return the state to pickle, such as for sending the text to a worker process
+
+        The Pango layout and the cairo objects kept for drawing can't be
+        pickled. They are dropped and rebuilt on demand, so the copy keeps
+        its outline but redraws its prefix, masks and layers from scratch.
+        """
+        state = self.__dict__.copy()
+        for name in ('_scratch', '_prefix', '_masks', '_masked_length',
+                     '_layers', '_layer_style', '_drawn_length'):
+            state.pop(name, None)
+        state['_layout'] = None
+        return state
+
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__.update(state)
+        self._prefix = (0, None)
+        self._scratch = cairo.Context(cairo.ImageSurface(cairo.FORMAT_ARGB32, 1, 1))
+        self._layers = None
+        self._masks = None
+
     def _init_path(self) -> None:
         """Initialize the text path"""
         try:
             logger.debug(f"Initializing text: {self.text}")
-            surface = cairo.ImageSurface(cairo.FORMAT_ARGB32, 1, 1)
-            ctx = cairo.Context(surface)
-
-            logger.debug("Creating Pango layout...")
-            layout = PangoCairo.create_layout(ctx)
-            font_desc = Pango.FontDescription(f"{self.font_name} {self.font_size}")
-            logger.debug(f"Using font: {self.font_name}")
-            layout.set_font_description(font_desc)
-            layout.set_text(self.text, -1)
-            layout.set_alignment(Pango.Alignment.RIGHT)
-            layout.set_auto_dir(True)
-
-            # Get text extents to calculate position
-            ink_rect, logical_rect = layout.get_pixel_extents()
-            logger.debug(f"Text extents - ink: {ink_rect}, logical: {logical_rect}")
-
-            if logical_rect.width == 0 or logical_rect.height == 0:
-                raise ValueError("Text layout has zero size - font might not be available")
-
-            # Store text dimensions for scene calculations
-            self.width = logical_rect.width
-            self.height = logical_rect.height
-
+            font = f"{self.font_name} {self.font_size}"
+            cached = layout_cache.get((self.text, font))
             # Position will be set by scene when adding the text
-            self._layout = layout
+            self._layout, self.width, self.height = cached if cached is not None else (None, None, None)
             self._calculate_path()
+            if self.width is None:
+                self._get_layout()
 
         except Exception as e:
             logger.error(f"Error initializing text: {e}")
             logger.debug(traceback.format_exc())
             raise
 
-    def _calculate_path(self) -> None:
-        """Calculate the path based on current position"""
+    def _get_layout(self) -> Pango.Layout:
+        """Return the shaped layout, shaping the text if its outline was loaded from disk"""
+        if self._layout is None:
+            font = f"{self.font_name} {self.font_size}"
+            cached = layout_cache.get((self.text, font))
+            if cached is None:
+                with profiler.stage('text.layout', self):
+                    cached = self._create_layout(font)
+                layout_cache.put((self.text, font), cached)
+            self._layout, self.width, self.height = cached
+        return self._layout
+
+    def _create_layout(self, font: str) -> Tuple[Pango.Layout, int, int]:
+        """
+        Shape the text with Pango
+
+        Args:
+            font: Pango font description string
+
+        Returns:
+            Tuple of (layout, width, height)
+        """
         surface = cairo.ImageSurface(cairo.FORMAT_ARGB32, 1, 1)
         ctx = cairo.Context(surface)
 
-        ctx.move_to(*self._position)
-        PangoCairo.layout_path(ctx, self._layout)
-        path = ctx.copy_path_flat()
+        logger.debug("Creating Pango layout...")
+        layout = PangoCairo.create_layout(ctx)
+        font_desc = Pango.FontDescription(font)
+        logger.debug(f"Using font: {self.font_name}")
+        layout.set_font_description(font_desc)
+        layout.set_text(self.text, -1)
+        layout.set_alignment(Pango.Alignment.RIGHT)
+        layout.set_auto_dir(True)
+
+        # Get text extents to calculate position
+        ink_rect, logical_rect = layout.get_pixel_extents()
+        logger.debug(f"Text extents - ink: {ink_rect}, logical: {logical_rect}")
+
+        if logical_rect.width == 0 or logical_rect.height == 0:
+            raise ValueError("Text layout has zero size - font might not be available")
 
-        self.strokes = self._group_strokes(path)
-        logger.debug(f"Created {len(self.strokes)} strokes")
-        self.stroke_lengths = self._calculate_lengths()
-        self.total_length = sum(self.stroke_lengths)
+        # Store text dimensions for scene calculations
+        return layout, logical_rect.width, logical_rect.height
 
-    def _group_strokes(self, path: List[Tuple[int, Tuple[float, float]]]) -> List[List[Tuple[int, Tuple[float, float]]]]:
+    def _calculate_path(self) -> None:
         """
-        Group path elements into continuous strokes
+        Calculate the path of the layout.
+
+        The path is relative to the layout origin; the position of the text
+        is applied as a translation when rendering, so moving the text or
+        adding it to another scene does not recalculate it.
+
+        Outlines missing from the in-memory cache are looked up in the
+        on-disk outline store first, which also holds the layout size, so
+        a text found there is never shaped.
+        """
+        surface = cairo.ImageSurface(cairo.FORMAT_ARGB32, 1, 1)
+        ctx = cairo.Context(surface)
+        tolerance = self._effective_tolerance()
+
+        if self.curves:
+            key = (self.text, f"{self.font_name} {self.font_size}", None, False, True)
+        else:
+            key = (self.text, f"{self.font_name} {self.font_size}", tolerance, self.simplify, False)
+        # Identifies the outline by value, unlike the id of the path object
+        self._path_key = key
+        self._stroke_path = path_cache.get(key)
+        if self._stroke_path is None and outline_store.enabled:
+            with profiler.stage('text.load', self):
+                self._stroke_path = self._load_outline(key)
+            if self._stroke_path is not None:
+                path_cache.put(key, self._stroke_path)
+        if self._stroke_path is None:
+            layout = self._get_layout()
+            with profiler.stage('text.flatten', self):
+                ctx.set_tolerance(tolerance)
+                ctx.move_to(0, 0)
+                PangoCairo.layout_path(ctx, layout)
+                outline = ctx.copy_path() if self.curves else ctx.copy_path_flat()
+                ctx.new_path()
+            with profiler.stage('text.measure', self):
+                self._stroke_path = StrokePath.from_cairo(outline)
+            if self.simplify and not self.curves:
+                with profiler.stage('text.simplify', self):
+                    self._stroke_path = self._stroke_path.simplified(tolerance)
+            path_cache.put(key, self._stroke_path)
+            self._store_outline(key)
+
+        logger.debug(f"Created {len(self._stroke_path)} strokes")
+        self.stroke_lengths = self._stroke_path.stroke_lengths
+        self.total_length = self._stroke_path.total_length
+
+        self._prefix: Tuple[int, Optional[cairo.Path]] = (0, None)
+        self._scratch = ctx
+        self._layers: Optional[List[Optional[Layer]]] = None
+        self._masks: Optional[Dict[Tuple[float, float], BlurredMask]] = None
+
+    def _store_key(self, key: tuple) -> Optional[tuple]:
+        """Extend a path cache key with the font file content, or return None if it is unknown"""
+        digest = font_digest(self.font_name)
+        return None if digest is None else key + (digest,)
+
+    def _load_outline(self, key: tuple) -> Optional[StrokePath]:
+        """Load the outline and layout size stored on disk under a path cache key"""
+        store_key = self._store_key(key)
+        stored = outline_store.get(store_key) if store_key is not None else None
+        if stored is None:
+            return None
+        arrays, meta = stored
+        if self._layout is None:
+            self.width, self.height = meta['width'], meta['height']
+        return StrokePath(**arrays)
+
+    def _store_outline(self, key: tuple) -> None:
+        """Save the outline and layout size on disk under a path cache key"""
+        if not outline_store.enabled:
+            return
+        store_key = self._store_key(key)
+        if store_key is not None:
+            outline_store.put(store_key, self._stroke_path.arrays(),
+                              {'width': self.width, 'height': self.height})
+
+    @property
+    def strokes(self) -> List[List[Tuple[int, Tuple[float, ...]]]]:
+        """The outline strokes as lists of cairo path elements, unpacked on demand"""
+        return self._stroke_path.strokes
+
+    def _effective_tolerance(self) -> float:
+        """Return the flattening tolerance used for the outline, in scene units"""
+        if self.tolerance is not None:
+            return self.tolerance
+        return auto_tolerance(self.font_size, self._scale, self._pixel_tolerance)
+
+    def set_level_of_detail(self, pixel_tolerance: float = DEFAULT_TOLERANCE, scale: float = 1.0) -> None:
+        """
+        Adapt the outline to the resolution it is rendered at
+
+        Texts with an explicit tolerance or curved outlines are not affected.
+        Otherwise the outline is recalculated when the derived tolerance
+        changes.
 
         Args:
-            path: List of path elements from cairo
+            pixel_tolerance: Acceptable deviation from the outline in output pixels
+            scale: Output pixels per scene unit
+        """
+        previous = self._effective_tolerance()
+        self._pixel_tolerance = pixel_tolerance
+        self._scale = scale
+        if not self.curves and self._effective_tolerance() != previous:
+            self._calculate_path()
 
-        Returns:
-            List of strokes, where each stroke is a list of path elements
+    def _prefix_path(self, count: int) -> cairo.Path:
         """
-        path_elements = list(path)
-        strokes = []
-        current_stroke = []
-
-        for i in range(len(path_elements)):
-            elem = path_elements[i]
-            if elem[0] == cairo.PATH_MOVE_TO:
-                if current_stroke:
-                    strokes.append(current_stroke)
-                current_stroke = [elem]
-            else:
-                current_stroke.append(elem)
-        if current_stroke:
-            strokes.append(current_stroke)
+        Return the path of the first count complete strokes.
+
+        The last prefix is kept, so while writing advances it only grows by
+        the strokes completed since the previous frame.
+        """
+        cached_count, cached_path = self._prefix
+        if cached_path is not None and cached_count == count:
+            return cached_path
 
-        # Sort strokes from right to left
-        strokes.sort(key=lambda s: -s[0][1][0])  # Sort by x-coordinate in reverse
-        return strokes
+        ctx = self._scratch
+        ctx.new_path()
+        first = 0
+        if cached_path is not None and cached_count < count:
+            ctx.append_path(cached_path)
+            first = cached_count
+        self._stroke_path.append_strokes(ctx, first, count)
+
+        path = ctx.copy_path()
+        ctx.new_path()
+        self._prefix = (count, path)
+        return path
 
-    def _calculate_lengths(self) -> List[float]:
+    def _path_at(self, target_length: float) -> cairo.Path:
         """
-        Calculate the length of each stroke
+        Build the path written up to target_length
+
+        Args:
+            target_length: Length along the strokes to draw up to
 
         Returns:
-            List of stroke lengths
+            Cairo path that can be appended to any context
         """
-        lengths = []
-        for stroke in self.strokes:
-            length = 0
-            for i in range(1, len(stroke)):
-                if stroke[i][0] == cairo.PATH_LINE_TO:
-                    x1, y1 = stroke[i-1][1]
-                    x2, y2 = stroke[i][1]
-                    length += math.sqrt((x2-x1)**2 + (y2-y1)**2)
-            lengths.append(length)
-        return lengths
+        complete = self._stroke_path.complete_strokes(target_length)
+        if complete == len(self._stroke_path) or target_length <= 0:
+            return self._prefix_path(complete)
 
-    def render(self, ctx: cairo.Context, t: float) -> None:
+        ctx = self._scratch
+        ctx.new_path()
+        ctx.append_path(self._prefix_path(complete))
+        self._stroke_path.append_stroke(ctx, complete, target_length)
+        path = ctx.copy_path()
+        ctx.new_path()
+        return path
+
+    def _path_between(self, start_length: float, end_length: float) -> cairo.Path:
         """
-        Render the text at time t
+        Build the path written between two lengths
 
         Args:
-            ctx: Cairo context to draw on
-            t: Time in seconds
+            start_length: Length along the strokes already written
+            end_length: Length along the strokes to draw up to
+
+        Returns:
+            Cairo path covering only the newly written part
         """
+        ctx = self._scratch
+        ctx.new_path()
+        self._stroke_path.append_between(ctx, start_length, end_length)
+        path = ctx.copy_path()
+        ctx.new_path()
+        return path
+
+    def _target_length(self, t: float) -> float:
+        """Return the length along the strokes written at time t"""
         if t > self.duration:
             t = self.duration
 
         progress = t / self.duration
-        target_length = progress * self.total_length
+        return progress * self.total_length
+
+    def _render_passes(self) -> List[RenderPass]:
+        """Return the passes drawn for the current style, bottom to top"""
+        passes = []
 
         # Apply shadow if specified
         if self.style.shadow_color:
-            ctx.save()
-            ctx.translate(*self.style.shadow_offset)
-            self._render_strokes(ctx, target_length, self.style.shadow_color)
-            ctx.restore()
+            passes.append(RenderPass(self.style.shadow_color, self.style.stroke_width,
+                                     offset=self.style.shadow_offset, blur=self.style.shadow_blur))
 
         # Apply glow if specified
         if self.style.glow_color and self.style.glow_radius > 0:
-            for i in range(3):
-                ctx.save()
-                ctx.set_line_width(self.style.stroke_width + self.style.glow_radius * (i+1)/3)
-                glow_alpha = self.style.glow_color.a * (3-i)/3
-                glow = self.style.glow_color.with_alpha(glow_alpha)
-                self._render_strokes(ctx, target_length, glow)
-                ctx.restore()
+            passes.append(RenderPass(self.style.glow_color, self.style.stroke_width + self.style.glow_radius,
+                                     blur=self.style.glow_radius))
 
         # Render fill if specified
         if self.style.fill_color:
+            passes.append(RenderPass(self.style.fill_color, self.style.stroke_width, fill=True))
+
+        # Render stroke
+        passes.append(RenderPass(self.style.stroke_color, self.style.stroke_width))
+        return passes
+
+    def render(self, ctx: cairo.Context, t: float) -> None:
+        """
+        Render the text at time t
+
+        Args:
+            ctx: Cairo context to draw on
+            t: Time in seconds
+        """
+        target_length = self._target_length(t)
+        passes = self._render_passes()
+        with profiler.stage('text.effects', self):
+            self._update_masks(target_length, passes)
+
+        with profiler.stage('text.path', self):
+            path = self._path_at(target_length)
+
+        with profiler.stage('text.stroke', self):
             ctx.save()
-            self._render_strokes(ctx, target_length, self.style.fill_color, True)
+            ctx.translate(*self._position)
+            for render_pass in passes:
+                self._render_pass(ctx, render_pass, path)
             ctx.restore()
 
-        # Render stroke
-        ctx.set_line_width(self.style.stroke_width)
-        self._render_strokes(ctx, target_length, self.style.stroke_color)
+    def _update_masks(self, target_length: float, passes: List[RenderPass]) -> None:
+        """
+        Bring the blurred masks of the passes up to target_length
 
-    def _render_strokes(self, ctx: cairo.Context, target_length: float, color: Color, fill: bool = False) -> None:
+        Masks are kept between frames and only the newly written strokes are
+        added to them. Going backwards in time redraws them from the start.
+        """
+        keys = {(p.line_width, p.blur) for p in passes if p.blur > 0}
+        if self._masks is None or set(self._masks) != keys:
+            extents = self._scene_extents()
+            self._masks = {key: BlurredMask(extents, *key) for key in keys}
+            self._masked_length = 0.0
+        elif target_length < self._masked_length:
+            for mask in self._masks.values():
+                mask.clear()
+            self._masked_length = 0.0
+
+        if self._masks and target_length > self._masked_length:
+            path = self._path_between(self._masked_length, target_length)
+            for mask in self._masks.values():
+                mask.draw(path, self._position)
+        self._masked_length = target_length
+
+    def render_key(self) -> Tuple:
+        """Return a key that changes whenever the fully written text would look different"""
+        return self._position, astuple(self.style), self._path_key
+
+    def frame_state(self, t: float) -> float:
+        """Return what the drawing at time t depends on besides the render key"""
+        return self._target_length(t)
+
+    def geometry_key(self) -> Tuple:
+        """Return the construction parameters the outline is built from"""
+        return self.text, self.font_name, self.font_size, self.tolerance, self.simplify, self.curves
+
+    def reuse_state(self, previous: 'Text') -> None:
+        """
+        Take over the drawing state of an equal text, such as one from before a reload
+
+        The prefix path, blurred masks and incremental layers are kept when
+        the other text has the same outline at the same position. Masks and
+        layers are checked against the style when they are used, so a changed
+        color or width still redraws them.
+        """
+        if previous._stroke_path is not self._stroke_path or previous._position != self._position:
+            return
+        for name in ('_prefix', '_masks', '_masked_length', '_layers', '_layer_style', '_drawn_length'):
+            if hasattr(previous, name):
+                setattr(self, name, getattr(previous, name))
+
+    @property
+    def supports_incremental(self) -> bool:
+        """Whether the text can be drawn by only adding the newly written ink"""
+        # The fill of a partial outline is not contained in later fills
+        return self.style.fill_color is None
+
+    def render_incremental(self, ctx: cairo.Context, t: float) -> None:
+        """
+        Render the text at time t, stroking only what was written since the last call
+
+        Each stroke pass keeps its own layer, so new ink is added on top of
+        what was already drawn and the layers are composited in pass order
+        along with the blurred masks. Going backwards in time, or changing
+        the style, redraws from the start.
+
+        Args:
+            ctx: Cairo context to draw on
+            t: Time in seconds
+        """
+        target_length = self._target_length(t)
+        passes = self._render_passes()
+        self._update_masks(target_length, passes)
+
+        # Styles share their mutable colors, so compare by value
+        style = astuple(self.style)
+        if self._layers is None or self._layer_style != style:
+            self._layers = [None if p.blur > 0 else
+                            Layer.from_extents(self._scene_extents(p.offset), 5 * p.line_width + 1)
+                            for p in passes]
+            self._layer_style = style
+            self._drawn_length = 0.0
+        elif target_length < self._drawn_length:
+            for layer in self._layers:
+                if layer:
+                    layer.clear()
+            self._drawn_length = 0.0
+
+        if target_length > self._drawn_length:
+            path = self._path_between(self._drawn_length, target_length)
+            for layer, render_pass in zip(self._layers, passes):
+                if layer:
+                    layer_ctx = layer.context()
+                    layer_ctx.translate(*self._position)
+                    self._render_pass(layer_ctx, render_pass, path)
+            self._drawn_length = target_length
+
+        for layer, render_pass in zip(self._layers, passes):
+            if layer:
+                layer.composite(ctx)
+            else:
+                ctx.save()
+                ctx.translate(*self._position)
+                self._render_pass(ctx, render_pass, None)
+                ctx.restore()
+
+    def _scene_extents(self, offset: Tuple[float, float] = (0, 0)) -> Tuple[float, float, float, float]:
+        """Return the scene extents of the outline points, shifted by offset"""
+        dx = offset[0] + self._position[0]
+        dy = offset[1] + self._position[1]
+        x0, y0, x1, y1 = self._stroke_path.extents
+        return x0 + dx, y0 + dy, x1 + dx, y1 + dy
+
+    def _render_pass(self, ctx: cairo.Context, render_pass: RenderPass, path: Optional[cairo.Path]) -> None:
+        """
+        Draw a single pass onto ctx
+
+        Args:
+            ctx: Cairo context translated to the text position
+            render_pass: Pass to draw
+            path: Path written so far; unused by blurred passes, which paint
+                their mask
+        """
+        ctx.save()
+        ctx.translate(*render_pass.offset)
+        if render_pass.blur > 0:
+            ctx.set_source_rgba(*render_pass.color.to_rgb())
+            mask = self._masks[(render_pass.line_width, render_pass.blur)]
+            mask.paint(ctx, (-self._position[0], -self._position[1]))
+        else:
+            ctx.set_line_width(render_pass.line_width)
+            self._render_strokes(ctx, path, render_pass.color, render_pass.fill)
+        ctx.restore()
+
+    def _render_strokes(self, ctx: cairo.Context, path: cairo.Path, color: Color, fill: bool = False) -> None:
         """
         Helper method to render strokes
 
         Args:
             ctx: Cairo context to draw on
-            target_length: Target length to draw up to
+            path: Path written so far, as returned by _path_at
             color: Color to use for rendering
             fill: Whether to fill the path instead of stroking
         """
-        current_length = 0
-
-        # Handle gradient if specified
+        # Handle gradient if specified. It runs in scene coordinates, while
+        # ctx is translated to the text position.
         if self.style.gradient and not fill:
-            pat = cairo.LinearGradient(0, 0,
-                                     *self.style.gradient_direction or (0, self.height))
+            x, y = self._position
+            dx, dy = self.style.gradient_direction or (0, self.height)
+            pat = cairo.LinearGradient(-x, -y, dx - x, dy - y)
             pat.add_color_stop_rgba(0, *self.style.gradient[0].to_rgb())
             pat.add_color_stop_rgba(1, *self.style.gradient[1].to_rgb())
             ctx.set_source(pat)
         else:
             ctx.set_source_rgba(*color.to_rgb())
 
-        # Create a single path for all strokes that should be rendered
+        # The same path is shared by every pass of a frame
         ctx.new_path()
-        for stroke_idx, stroke in enumerate(self.strokes):
-            if current_length >= target_length:
-                break
-
-            ctx.move_to(*stroke[0][1])
-            stroke_length = self.stroke_lengths[stroke_idx]
-
-            for i in range(1, len(stroke)):
-                if stroke[i][0] == cairo.PATH_LINE_TO:
-                    x1, y1 = stroke[i-1][1]
-                    x2, y2 = stroke[i][1]
-                    segment_length = math.sqrt((x2-x1)**2 + (y2-y1)**2)
-
-                    if current_length + segment_length <= target_length:
-                        ctx.line_to(x2, y2)
-                        current_length += segment_length
-                    else:
-                        remaining = target_length - current_length
-                        t = remaining / segment_length
-                        new_x = x1 + (x2 - x1) * t
-                        new_y = y1 + (y2 - y1) * t
-                        ctx.line_to(new_x, new_y)
-                        break
+        ctx.append_path(path)
 
         # Fill or stroke the entire path at once
         if fill:
@@ -243,7 +568,8 @@ class Text:
             self.position_type,
             self.padding
         )
-        self._calculate_path()
+        self._layers = None
+        self._masks = None
 
     @staticmethod
     def list_available_fonts() -> None:
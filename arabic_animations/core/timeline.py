@@ -0,0 +1,173 @@
+import bisect
+import math
+from typing import Any, Iterator, List, Tuple
+
+class Timeline:
+    """
+    The objects of a scene, indexed by draw order and time.
+
+    Objects are drawn by layer, and in the order they were added within a
+    layer. Each object is written from its start time for its duration, and
+    is finished from then on. Objects without a render_key can't be cached,
+    so they are never considered finished.
+
+    Finished and active objects are indexed separately. The objects active
+    at a time are found by an interval stabbing query, and finished objects
+    are counted and listed per range of draw indices, so the queries for a
+    frame take polylogarithmic time plus the number of objects they return,
+    wherever in draw order the active objects are.
+    """
+    def __init__(self):
+        # (layer, sequence number, object)
+        self._entries: List[Tuple[int, int, Any]] = []
+        self._objects: List[Any] = []
+        self._starts: List[float] = []
+        self._ends: List[float] = []
+        self._leaves = 0
+        # Sorted end times under each node of a tree over draw indices
+        self._end_lists: List[List[float]] = []
+        # Earliest end time under each node of the same tree
+        self._min_ends: List[float] = []
+        # Interval tree over the start and end times: draw indices of the
+        # objects active throughout each node's time span
+        self._times: List[float] = []
+        self._spans: List[List[int]] = []
+        self._time_leaves = 0
+        self._dirty = False
+        self._duration = 0.0
+        # Changes whenever objects are added, invalidating anything derived from them
+        self.version = 0
+
+    def add(self, obj: Any, start: float, layer: int = 0) -> None:
+        """
+        Add an object starting at a time
+
+        Args:
+            obj: Object with a duration, whose start_time is set here
+            start: Time in seconds the object starts being written
+            layer: Objects on higher layers are drawn over lower ones
+        """
+        obj.start_time = start
+        self._entries.append((layer, len(self._entries), obj))
+        self._dirty = True
+        self._duration = max(self._duration, start + obj.duration)
+        self.version += 1
+
+    def _build(self) -> None:
+        if not self._dirty:
+            return
+        self._entries.sort(key=lambda entry: entry[:2])
+        self._objects = [obj for _, _, obj in self._entries]
+        starts = [obj.start_time for obj in self._objects]
+        ends = [obj.start_time + obj.duration if hasattr(obj, 'render_key') else math.inf
+                for obj in self._objects]
+        self._starts = sorted(starts)
+        self._ends = sorted(ends)
+
+        # Tree over draw indices, for counting and listing finished objects
+        leaves = 1 << max(0, len(ends) - 1).bit_length()
+        end_lists: List[List[float]] = [[] for _ in range(2 * leaves)]
+        min_ends = [math.inf] * (2 * leaves)
+        for index, end in enumerate(ends):
+            end_lists[leaves + index] = [end]
+            min_ends[leaves + index] = end
+        for node in range(leaves - 1, 0, -1):
+            end_lists[node] = sorted(end_lists[2 * node] + end_lists[2 * node + 1])
+            min_ends[node] = min(min_ends[2 * node], min_ends[2 * node + 1])
+        self._leaves, self._end_lists, self._min_ends = leaves, end_lists, min_ends
+
+        # Interval tree over elementary time spans [times[j], times[j + 1]),
+        # the last one open-ended. Each object is stored in the nodes that
+        # exactly cover its span from start to end.
+        times = sorted(set(starts) | {end for end in ends if end != math.inf})
+        time_leaves = 1 << max(0, len(times) - 1).bit_length()
+        spans: List[List[int]] = [[] for _ in range(2 * time_leaves)]
+        for index, (start, end) in enumerate(zip(starts, ends)):
+            if end <= start:
+                continue
+            lo = bisect.bisect_left(times, start) + time_leaves
+            hi = (len(times) if end == math.inf else bisect.bisect_left(times, end)) + time_leaves
+            while lo < hi:
+                if lo & 1:
+                    spans[lo].append(index)
+                    lo += 1
+                if hi & 1:
+                    hi -= 1
+                    spans[hi].append(index)
+                lo >>= 1
+                hi >>= 1
+        self._times, self._spans, self._time_leaves = times, spans, time_leaves
+        self._dirty = False
+
+    @property
+    def objects(self) -> List[Any]:
+        """All objects in draw order"""
+        self._build()
+        return self._objects
+
+    @property
+    def duration(self) -> float:
+        """Time at which the last object is fully written"""
+        return self._duration
+
+    def started_count(self, t: float) -> int:
+        """Return how many objects have started by time t"""
+        self._build()
+        return bisect.bisect_right(self._starts, t)
+
+    def active(self, t: float) -> List[int]:
+        """Return the draw indices of the objects started but not finished at time t, in draw order"""
+        self._build()
+        slot = bisect.bisect_right(self._times, t) - 1
+        if slot < 0:
+            return []
+        found: List[int] = []
+        node = slot + self._time_leaves
+        while node:
+            found.extend(self._spans[node])
+            node >>= 1
+        found.sort()
+        return found
+
+    def finished_count(self, lo: int, hi: int, t: float) -> int:
+        """
+        Return how many objects with draw indices in [lo, hi) are finished at time t
+
+        The finished objects of a range only grow with t, so ranges with
+        equal counts at two times hold the same finished objects.
+        """
+        self._build()
+        lists = self._end_lists
+        count = 0
+        lo += self._leaves
+        hi += self._leaves
+        while lo < hi:
+            if lo & 1:
+                count += bisect.bisect_right(lists[lo], t)
+                lo += 1
+            if hi & 1:
+                hi -= 1
+                count += bisect.bisect_right(lists[hi], t)
+            lo >>= 1
+            hi >>= 1
+        return count
+
+    def finished(self, lo: int, hi: int, t: float) -> Iterator[int]:
+        """Yield the draw indices in [lo, hi) of the objects finished at time t, in draw order"""
+        self._build()
+        min_ends = self._min_ends
+        # Nodes with the range of draw indices they cover, left subtrees first
+        stack = [(1, 0, self._leaves)]
+        while stack:
+            node, first, last = stack.pop()
+            if last <= lo or first >= hi or min_ends[node] > t:
+                continue
+            if last - first == 1:
+                yield first
+                continue
+            middle = (first + last) // 2
+            stack.append((2 * node + 1, middle, last))
+            stack.append((2 * node, first, middle))
+
+    def __len__(self) -> int:
+        return len(self._entries)
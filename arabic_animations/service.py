@@ -0,0 +1,439 @@
+import asyncio
+import concurrent.futures
+import json
+import logging
+import multiprocessing
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+from .core.batch import BatchJob, job_from_record, render_job
+from .core.text import Text
+
+logger = logging.getLogger('arabic_animations')
+
+# Largest request body accepted, job specs are small
+MAX_BODY = 1 << 20
+
+_REASONS = {
+    200: "OK",
+    202: "Accepted",
+    400: "Bad Request",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    409: "Conflict",
+    413: "Payload Too Large",
+    429: "Too Many Requests",
+    500: "Internal Server Error",
+}
+
+# Queue progress is sent to from worker processes
+_progress: Any = None
+
+def _init_worker(progress: Any, warm_font: Optional[str]) -> None:
+    """Prepare a worker process, loading the font map before the first job arrives"""
+    global _progress
+    _progress = progress
+    if warm_font:
+        try:
+            Text("بسم", font_name=warm_font)
+        except Exception:
+            # Font problems are reported by the jobs that use the font
+            pass
+
+def _ping() -> int:
+    return os.getpid()
+
+def _render(job_id: str, job: BatchJob) -> int:
+    """Render a job in a worker, reporting progress to the service"""
+    progress = _progress
+    if progress is None:
+        return render_job(job)
+    return render_job(job, lambda done, total: progress.put((job_id, done, total)))
+
+@dataclass
+class ServiceJob:
+    """State of a job submitted to the render service"""
+    id: str
+    job: BatchJob
+    # queued, running, done or failed
+    status: str = 'queued'
+    frames: int = 0
+    total_frames: int = 0
+    error: Optional[str] = None
+    submitted: float = field(default_factory=time.time)
+    started: Optional[float] = None
+    finished: Optional[float] = None
+    # Set and replaced whenever the state changes
+    changed: asyncio.Event = field(default_factory=asyncio.Event, repr=False)
+
+    @property
+    def done(self) -> bool:
+        return self.status in ('done', 'failed')
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "status": self.status,
+            "output": self.job.output,
+            "frames": self.frames,
+            "total_frames": self.total_frames,
+            "error": self.error,
+            "submitted": self.submitted,
+            "started": self.started,
+            "finished": self.finished,
+        }
+
+class RenderService:
+    """
+    A queue of render jobs served by a pool of warm worker processes.
+
+    Jobs wait in a bounded queue and at most `workers` of them render at
+    once. The worker processes are started and warmed up by start(), so
+    jobs pay no interpreter or font loading cost. Progress reported by the
+    workers is forwarded to everyone following a job.
+
+    Args:
+        output_dir: Directory outputs are written to. Job outputs must lie
+            inside it.
+        workers: Number of jobs rendered at once
+        max_queue: Maximum number of waiting jobs; more are rejected
+        warm_font: Font each worker loads when it starts
+        executor: Executor running the jobs, by default a pool of spawned
+            processes owned by the service. A thread pool renders in this
+            process, which is convenient for tests.
+        max_history: Number of finished jobs kept for status queries
+    """
+    def __init__(self, output_dir: str, workers: int = 1, max_queue: int = 64,
+                 warm_font: Optional[str] = "DecoType Thuluth",
+                 executor: Optional[concurrent.futures.Executor] = None,
+                 max_history: int = 1000):
+        self.output_dir = Path(output_dir).resolve()
+        self.workers = workers
+        self.max_queue = max_queue
+        self.warm_font = warm_font
+        self.max_history = max_history
+        self.running = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self._executor = executor
+        self._owns_executor = executor is None
+        self._progress = multiprocessing.get_context('spawn').Queue()
+        self._jobs: 'OrderedDict[str, ServiceJob]' = OrderedDict()
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._started = time.time()
+
+    async def start(self) -> None:
+        """Start the workers and wait until every one of them is ready"""
+        self._loop = asyncio.get_running_loop()
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        if self._executor is None:
+            self._executor = self._create_executor()
+        else:
+            # Jobs on a given executor may run in this process
+            _init_worker(self._progress, None)
+        self._queue = asyncio.Queue(self.max_queue)
+        threading.Thread(target=self._forward_progress, name='progress', daemon=True).start()
+
+        await asyncio.gather(*(self._loop.run_in_executor(self._executor, _ping)
+                               for _ in range(self.workers)))
+        self._tasks = [asyncio.ensure_future(self._dispatch()) for _ in range(self.workers)]
+        self._started = time.time()
+
+    def _create_executor(self) -> concurrent.futures.ProcessPoolExecutor:
+        return concurrent.futures.ProcessPoolExecutor(
+            self.workers, mp_context=multiprocessing.get_context('spawn'),
+            initializer=_init_worker, initargs=(self._progress, self.warm_font))
+
+    def _replace_broken_executor(self, executor: concurrent.futures.Executor) -> None:
+        """Start a new pool in place of one whose worker died, unless another job already did"""
+        if executor is not self._executor or not self._owns_executor:
+            return
+        logger.error("A worker process died, restarting the worker pool")
+        executor.shutdown(wait=False)
+        self._executor = self._create_executor()
+
+    async def close(self) -> None:
+        """Stop dispatching jobs and shut the workers down"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._progress.put(None)
+        if self._owns_executor and self._executor is not None:
+            self._executor.shutdown(wait=False)
+
+    def submit(self, spec: Dict[str, Any]) -> ServiceJob:
+        """
+        Queue a job
+
+        Args:
+            spec: Job fields, named like the columns of a batch manifest.
+                The output is optional and relative to the output directory.
+
+        Raises:
+            ValueError: If the spec is invalid
+            asyncio.QueueFull: If max_queue jobs are already waiting
+        """
+        job_id = uuid.uuid4().hex[:12]
+        spec = dict(spec)
+        spec.setdefault('output', f"{job_id}.mp4")
+        job = job_from_record(spec, self.output_dir)
+        output = Path(job.output).resolve()
+        if self.output_dir not in output.parents:
+            raise ValueError("output must be inside the output directory")
+        job.output = str(output)
+
+        entry = ServiceJob(job_id, job)
+        try:
+            self._queue.put_nowait(entry)
+        except asyncio.QueueFull:
+            self.rejected += 1
+            raise
+        self._jobs[job_id] = entry
+        self._forget_finished()
+        return entry
+
+    def get(self, job_id: str) -> Optional[ServiceJob]:
+        return self._jobs.get(job_id)
+
+    def jobs(self) -> List[ServiceJob]:
+        return list(self._jobs.values())
+
+    def metrics(self) -> Dict[str, Any]:
+        """Return the queue depth, activity and totals of the service"""
+        return {
+            "workers": self.workers,
+            "queued": self._queue.qsize() if self._queue else 0,
+            "max_queue": self.max_queue,
+            "running": self.running,
+            "completed": self.completed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "uptime": time.time() - self._started,
+        }
+
+    async def events(self, entry: ServiceJob) -> AsyncIterator[Dict[str, Any]]:
+        """Yield the state of a job now and after every change, until it finishes"""
+        while True:
+            changed = entry.changed
+            yield entry.to_dict()
+            if entry.done:
+                return
+            await changed.wait()
+
+    def _changed(self, entry: ServiceJob) -> None:
+        changed, entry.changed = entry.changed, asyncio.Event()
+        changed.set()
+
+    def _forget_finished(self) -> None:
+        """Drop the oldest finished jobs beyond max_history"""
+        finished = [job_id for job_id, entry in self._jobs.items() if entry.done]
+        for job_id in finished[:max(0, len(finished) - self.max_history)]:
+            del self._jobs[job_id]
+
+    def _forward_progress(self) -> None:
+        """Pass progress from the workers to the event loop, on a thread of its own"""
+        while True:
+            item = self._progress.get()
+            if item is None:
+                return
+            self._loop.call_soon_threadsafe(self._on_progress, *item)
+
+    def _on_progress(self, job_id: str, frames: int, total_frames: int) -> None:
+        entry = self._jobs.get(job_id)
+        if entry is not None and not entry.done:
+            entry.frames, entry.total_frames = frames, total_frames
+            self._changed(entry)
+
+    async def _dispatch(self) -> None:
+        """Run queued jobs one at a time"""
+        while True:
+            entry = await self._queue.get()
+            entry.status = 'running'
+            entry.started = time.time()
+            self.running += 1
+            self._changed(entry)
+            executor = self._executor
+            try:
+                frames = await self._loop.run_in_executor(executor, _render, entry.id, entry.job)
+            except BrokenProcessPool:
+                # The job may have killed its worker, so it is not retried
+                logger.warning(f"Job {entry.id} failed: its worker process died")
+                entry.status = 'failed'
+                entry.error = "Internal error: the worker process rendering the job died"
+                self.failed += 1
+                self._replace_broken_executor(executor)
+            except Exception as e:
+                logger.warning(f"Job {entry.id} failed: {e}")
+                entry.status = 'failed'
+                entry.error = f"{type(e).__name__}: {e}"
+                self.failed += 1
+            else:
+                entry.status = 'done'
+                entry.frames = entry.total_frames = frames
+                self.completed += 1
+            finally:
+                self.running -= 1
+                entry.finished = time.time()
+                self._changed(entry)
+                self._queue.task_done()
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """Serve one HTTP request"""
+        try:
+            try:
+                method, target, body = await _read_request(reader)
+                await self._route(method, target.split('?', 1)[0].rstrip('/'), body, writer)
+            except _HttpError as e:
+                await _send_json(writer, e.status, {"error": e.message})
+            except (ConnectionError, asyncio.IncompleteReadError):
+                pass
+            except Exception as e:
+                logger.exception("Error handling request")
+                await _send_json(writer, 500, {"error": str(e)})
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def _route(self, method: str, path: str, body: bytes, writer: asyncio.StreamWriter) -> None:
+        parts = path.strip('/').split('/')
+
+        if parts == ['metrics']:
+            _allow(method, 'GET')
+            await _send_json(writer, 200, self.metrics())
+        elif parts == ['jobs']:
+            _allow(method, 'GET', 'POST')
+            if method == 'GET':
+                await _send_json(writer, 200, [entry.to_dict() for entry in self.jobs()])
+                return
+            try:
+                spec = json.loads(body or b'{}')
+                if not isinstance(spec, dict):
+                    raise ValueError("expected a JSON object")
+                entry = self.submit(spec)
+            except (ValueError, TypeError) as e:
+                raise _HttpError(400, str(e))
+            except asyncio.QueueFull:
+                raise _HttpError(429, f"Queue is full ({self.max_queue} jobs waiting)")
+            await _send_json(writer, 202, entry.to_dict(), {"Location": f"/jobs/{entry.id}"})
+        elif len(parts) in (2, 3) and parts[0] == 'jobs':
+            _allow(method, 'GET')
+            entry = self.get(parts[1])
+            if entry is None:
+                raise _HttpError(404, f"No job {parts[1]}")
+            if len(parts) == 2:
+                await _send_json(writer, 200, entry.to_dict())
+            elif parts[2] == 'events':
+                await self._send_events(entry, writer)
+            elif parts[2] == 'output':
+                if entry.status != 'done':
+                    raise _HttpError(409, f"Job is {entry.status}")
+                await _send_file(writer, Path(entry.job.output), "video/mp4")
+            else:
+                raise _HttpError(404, f"Unknown path {path}")
+        else:
+            raise _HttpError(404, f"Unknown path {path}")
+
+    async def _send_events(self, entry: ServiceJob, writer: asyncio.StreamWriter) -> None:
+        """Stream job states as JSON Lines until the job finishes"""
+        writer.write(_head(200, "application/x-ndjson", {"Transfer-Encoding": "chunked"}))
+        async for state in self.events(entry):
+            line = json.dumps(state).encode() + b"\n"
+            writer.write(b"%x\r\n%s\r\n" % (len(line), line))
+            await writer.drain()
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+
+class _HttpError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+def _allow(method: str, *methods: str) -> None:
+    if method not in methods:
+        raise _HttpError(405, f"Use {' or '.join(methods)}")
+
+async def _read_request(reader: asyncio.StreamReader) -> Tuple[str, str, bytes]:
+    """Read a request and return its method, target and body"""
+    line = await reader.readline()
+    if not line:
+        raise ConnectionError("Connection closed")
+    try:
+        method, target, _ = line.decode('latin-1').rstrip('\r\n').split(' ', 2)
+    except ValueError:
+        raise _HttpError(400, "Malformed request line")
+
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+
+    try:
+        length = int(headers.get('content-length', 0))
+    except ValueError:
+        raise _HttpError(400, "Invalid Content-Length")
+    if length > MAX_BODY:
+        raise _HttpError(413, f"Request body over {MAX_BODY} bytes")
+    body = await reader.readexactly(length) if length else b''
+    return method.upper(), target, body
+
+def _head(status: int, content_type: str, headers: Optional[Dict[str, str]] = None) -> bytes:
+    lines = [f"HTTP/1.1 {status} {_REASONS.get(status, '')}",
+             f"Content-Type: {content_type}",
+             "Connection: close"]
+    lines.extend(f"{name}: {value}" for name, value in (headers or {}).items())
+    return ("\r\n".join(lines) + "\r\n\r\n").encode('latin-1')
+
+async def _send_json(writer: asyncio.StreamWriter, status: int, data: Any,
+                     headers: Optional[Dict[str, str]] = None) -> None:
+    body = json.dumps(data).encode()
+    writer.write(_head(status, "application/json", dict(headers or {}, **{"Content-Length": str(len(body))})))
+    writer.write(body)
+    await writer.drain()
+
+async def _send_file(writer: asyncio.StreamWriter, path: Path, content_type: str) -> None:
+    try:
+        size = path.stat().st_size
+    except OSError:
+        raise _HttpError(404, "Output no longer exists")
+    writer.write(_head(200, content_type, {"Content-Length": str(size)}))
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 16), b''):
+            writer.write(block)
+            await writer.drain()
+
+async def serve(service: RenderService, host: str = '127.0.0.1', port: int = 8750,
+                socket_path: Optional[str] = None) -> None:
+    """
+    Run the service over HTTP until cancelled
+
+    Args:
+        service: Service to run, started here
+        host: Address to listen on
+        port: Port to listen on
+        socket_path: Unix socket to listen on instead of host and port
+    """
+    await service.start()
+    try:
+        if socket_path:
+            server = await asyncio.start_unix_server(service.handle, path=socket_path)
+            logger.info(f"Render service listening on {socket_path}")
+        else:
+            server = await asyncio.start_server(service.handle, host, port)
+            logger.info(f"Render service listening on http://{host}:{port}")
+        async with server:
+            await server.serve_forever()
+    finally:
+        await service.close()
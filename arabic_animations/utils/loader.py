@@ -0,0 +1,28 @@
+import logging
+from typing import Optional, Dict, Any
+from arabic_animations.core.scene import Scene
+from .scenefile import is_scene_file, load_scene_file
+
+logger = logging.getLogger('arabic_animations')
+
+def load_scene(script_path: str) -> Optional[Scene]:
+    """
+    Load the scene defined by a scene script or scene file
+
+    Args:
+        script_path: Path to a Python script defining a 'scene' object, or
+            to a JSON, YAML or TOML scene file
+
+    Returns:
+        The scene, or None if the script does not define one
+    """
+    if is_scene_file(script_path):
+        return load_scene_file(script_path)
+
+    namespace: Dict[str, Any] = {}
+    with open(script_path) as f:
+        script_content = f.read()
+        logger.debug(f"Script content:\n{script_content}")
+        exec(script_content, namespace)
+
+    return namespace.get('scene')
@@ -1,17 +1,23 @@
-import numpy as np
 import logging
+import time
 import traceback
-from PyQt5.QtWidgets import QApplication, QMainWindow, QLabel, QPushButton, QVBoxLayout, QWidget
+from PyQt5.QtWidgets import (QApplication, QMainWindow, QLabel, QPushButton, QSizePolicy,
+                             QVBoxLayout, QWidget)
 from PyQt5.QtCore import Qt, QTimer, QFileSystemWatcher
-from PyQt5.QtGui import QImage, QPixmap, QResizeEvent
+from PyQt5.QtGui import QCloseEvent, QImage, QPixmap, QResizeEvent
 from typing import Optional, List, Dict, Any
 from arabic_animations.core.scene import Scene
+from arabic_animations.core.prefetch import FramePrefetcher
+from .scenefile import is_scene_file, load_scene_file
 import importlib.util
 import sys
 import os
 
 logger = logging.getLogger('arabic_animations')
 
+# How much coarser outlines are flattened in draft mode
+DRAFT_TOLERANCE_FACTOR = 4.0
+
 class PreviewWindow(QMainWindow):
     def __init__(self, script_path: str, verbose: bool = False) -> None:
         super().__init__()
@@ -19,6 +25,16 @@ class PreviewWindow(QMainWindow):
         self.verbose = verbose
         self.current_time: float = 0
         self.is_playing: bool = True
+        self.draft: bool = False
+        self.achieved_fps: float = 0.0
+        self._prefetcher: Optional[FramePrefetcher] = None
+        # Playback clock: the tick due at _clock_start, counting up with wall-clock time
+        self._clock_tick = 0
+        self._clock_start = time.perf_counter()
+        # Frames shown and ticks passed since the fps was last reported
+        self._shown = 0
+        self._stats_tick = 0
+        self._stats_start = self._clock_start
 
         # Load initial scene
         self.scene = self._load_scene()
@@ -30,8 +46,11 @@ class PreviewWindow(QMainWindow):
         self._setup_ui()
 
     def _load_scene(self) -> Scene:
-        """Load scene from script file"""
+        """Load scene from script or scene file"""
         try:
+            if is_scene_file(self.script_path):
+                return load_scene_file(self.script_path)
+
             # Create a new module name based on the file path
             module_name = os.path.splitext(os.path.basename(self.script_path))[0]
 
@@ -60,10 +79,16 @@ class PreviewWindow(QMainWindow):
         """Reload the scene when the script file changes"""
         logger.info("Detected file change, reloading scene...")
         try:
+            # Unchanged texts find their outlines in the layout and path caches
             new_scene = self._load_scene()
             if new_scene:
-                self.scene = new_scene
-                self.current_time = 0
+                previous, self.scene = self.scene, new_scene
+                # Carry on from the time shown, if the edited scene is still that long
+                tick = round(self.current_time * new_scene.fps)
+                if tick > new_scene.duration * new_scene.fps:
+                    tick = 0
+                self.current_time = tick / new_scene.fps
+                self._start_prefetcher(tick, previous)
                 logger.info("Scene reloaded successfully")
         except Exception as e:
             logger.error(f"Error reloading scene: {e}")
@@ -79,6 +104,9 @@ class PreviewWindow(QMainWindow):
 
         # Image display
         self.image_label = QLabel()
+        # Size the label from the window, not from the frames shown in it
+        self.image_label.setSizePolicy(QSizePolicy.Ignored, QSizePolicy.Ignored)
+        self.image_label.setAlignment(Qt.AlignCenter)
         layout.addWidget(self.image_label)
 
         # Controls
@@ -87,57 +115,143 @@ class PreviewWindow(QMainWindow):
         self.play_button.clicked.connect(self.toggle_play)
         self.reset_button = QPushButton('Reset')
         self.reset_button.clicked.connect(self.reset)
+        self.draft_button = QPushButton('Draft')
+        self.draft_button.setCheckable(True)
+        self.draft_button.toggled.connect(self.toggle_draft)
 
         controls_layout.addWidget(self.play_button)
         controls_layout.addWidget(self.reset_button)
+        controls_layout.addWidget(self.draft_button)
         layout.addLayout(controls_layout)
 
-        # Timer for animation
+        # Re-render at the new size once the window stops being resized
+        self.resize_timer = QTimer()
+        self.resize_timer.setSingleShot(True)
+        self.resize_timer.timeout.connect(self._resized)
+
+        # Frames are rendered ahead on a worker thread; the timer only shows them
+        self._start_prefetcher()
         self.timer = QTimer()
+        self.timer.setTimerType(Qt.PreciseTimer)
         self.timer.timeout.connect(self.update_frame)
-        self.timer.start(1000 // self.scene.fps)
+        # Poll twice per frame so frames are shown close to when they are due
+        self.timer.start(max(1, 500 // self.scene.fps))
 
         # Set initial size
         self.resize(1280, 720)
 
+    def _render_scale(self) -> float:
+        """Return the scale fitting the scene into the image label, never above full size"""
+        size = self.image_label.size()
+        scale = min(size.width() / self.scene.width, size.height() / self.scene.height, 1.0)
+        # The label can shrink to nothing; still render frames at least a pixel wide
+        return max(scale, 1 / min(self.scene.width, self.scene.height))
+
+    def _start_prefetcher(self, tick: int = 0, previous: Optional[Scene] = None) -> None:
+        """
+        Render the current scene ahead from tick on a new worker thread
+
+        Args:
+            tick: Tick to start playing from
+            previous: Scene the current one replaces, whose drawing state is reused
+        """
+        if self._prefetcher:
+            self._prefetcher.stop()
+        self._prefetcher = None
+        if self.scene:
+            # Outlines only need to be as detailed as the pixels they are drawn at
+            scale = self._render_scale()
+            tolerance = self.scene.tolerance * (DRAFT_TOLERANCE_FACTOR if self.draft else 1.0)
+            self.scene.set_level_of_detail(scale, tolerance)
+            if previous:
+                self.scene.reuse_state(previous)
+            self._prefetcher = FramePrefetcher(self.scene, scale=scale)
+            self._prefetcher.seek(tick)
+            self._prefetcher.start()
+        self._restart_clock(tick)
+
+    def _resized(self) -> None:
+        """Render at the new size from the tick due now, if the size changed"""
+        if self._prefetcher and self._prefetcher.scale != self._render_scale():
+            self._start_prefetcher(self._playhead())
+
+    def _restart_clock(self, tick: int) -> None:
+        self._clock_tick = tick
+        self._clock_start = time.perf_counter()
+        self._shown = 0
+        self._stats_tick = tick
+        self._stats_start = self._clock_start
+
+    def _playhead(self) -> int:
+        """Return the tick due now"""
+        if not self.is_playing or not self.scene:
+            return self._clock_tick
+        return self._clock_tick + int((time.perf_counter() - self._clock_start) * self.scene.fps)
+
     def update_frame(self) -> None:
-        """Update the current frame"""
-        if not self.scene:
+        """Show the newest rendered frame that is due, dropping frames that are late"""
+        if not self.scene or not self._prefetcher:
             return
 
-        if self.is_playing:
-            if self.verbose:
-                logger.debug(f"Rendering frame at t={self.current_time:.3f}")
+        prefetcher = self._prefetcher
+        if prefetcher.error is not None:
+            return
+        tick = self._playhead()
+        prefetcher.set_playhead(tick)
+        entry = prefetcher.take(tick)
+        if entry is None:
+            return
 
+        shown, frame = entry
+        self._shown += 1
+        self.current_time = prefetcher.time_of(shown)
+        if self.verbose:
+            logger.debug(f"Showing frame at t={self.current_time:.3f}")
+        if frame is not None:
             try:
-                frame = self.scene.render_frame(self.current_time)
-                if frame is not None:
-                    height, width = frame.shape[:2]
-                    bytes_per_line = 4 * width
+                height, width = frame.shape[:2]
+                bytes_per_line = 4 * width
 
-                    # Convert frame to QImage with correct color space
-                    q_img = QImage(frame.data, width, height, bytes_per_line, QImage.Format_RGBA8888)
-                    pixmap = QPixmap.fromImage(q_img)
+                # Wrap the buffer without copying; cairo's ARGB32 matches Qt's native ARGB32 layout
+                q_img = QImage(frame.data, width, height, bytes_per_line, QImage.Format_ARGB32_Premultiplied)
+                pixmap = QPixmap.fromImage(q_img)
 
-                    # Scale pixmap to fit window while maintaining aspect ratio
-                    scaled_pixmap = pixmap.scaled(
+                # Frames are rendered to fit the label, unless it is larger than the scene
+                if prefetcher.scale >= 1.0:
+                    pixmap = pixmap.scaled(
                         self.image_label.size(),
                         Qt.KeepAspectRatio,
                         Qt.SmoothTransformation  # Use better quality scaling
                     )
-                    self.image_label.setPixmap(scaled_pixmap)
-
-                self.current_time += 1/self.scene.fps
-                if self.current_time > self.scene.duration:
-                    self.current_time = 0
-
+                self.image_label.setPixmap(pixmap)
             except Exception as e:
-                logger.error(f"Error rendering frame: {e}")
+                logger.error(f"Error showing frame: {e}")
                 if self.verbose:
                     logger.debug(traceback.format_exc())
+            finally:
+                # The pixmap holds its own copy of the pixels
+                prefetcher.release(frame)
+        self._report_fps(tick)
+
+    def _report_fps(self, tick: int) -> None:
+        """Show the achieved frame rate and the frames dropped about once a second"""
+        elapsed = time.perf_counter() - self._stats_start
+        if elapsed < 1.0:
+            return
+        self.achieved_fps = self._shown / elapsed
+        dropped = max(0, tick - self._stats_tick - self._shown)
+        self.setWindowTitle(f"Animation Preview - {self.achieved_fps:.1f} fps"
+                            + (f", {dropped} dropped" if dropped else ""))
+        if self.verbose:
+            logger.debug(f"Preview at {self.achieved_fps:.1f} of {self.scene.fps} fps, {dropped} frames dropped")
+        self._shown = 0
+        self._stats_tick = tick
+        self._stats_start += elapsed
 
     def toggle_play(self) -> None:
         """Toggle play/pause state"""
+        # Freeze or restart the clock at the tick due now
+        self._restart_clock(self._playhead())
         self.is_playing = not self.is_playing
         self.play_button.setText('Pause' if self.is_playing else 'Play')
         logger.info("Preview " + ("Playing" if self.is_playing else "Paused"))
@@ -145,16 +259,33 @@ class PreviewWindow(QMainWindow):
     def reset(self) -> None:
         """Reset animation to beginning"""
         self.current_time = 0
+        if self._prefetcher:
+            self._prefetcher.seek(0)
+        self._restart_clock(0)
         logger.info("Reset to beginning")
 
+    def toggle_draft(self, draft: bool) -> None:
+        """Switch between full quality and coarser, faster outlines"""
+        self.draft = draft
+        self._start_prefetcher(self._playhead())
+        logger.info("Draft quality" if draft else "Full quality")
+
+    def closeEvent(self, event: QCloseEvent) -> None:
+        """Stop the render thread with the window"""
+        if self._prefetcher:
+            self._prefetcher.stop()
+        super().closeEvent(event)
+
     def resizeEvent(self, event: QResizeEvent) -> None:
         """Handle window resize events"""
         super().resizeEvent(event)
         if self.image_label.pixmap():
-            # Rescale image when window is resized
+            # Rescale the image shown until frames are rendered at the new size
             scaled_pixmap = self.image_label.pixmap().scaled(
                 self.image_label.size(), Qt.KeepAspectRatio)
             self.image_label.setPixmap(scaled_pixmap)
+        if self.scene:
+            self.resize_timer.start(200)
 
 class LivePreview:
     def __init__(self, script_path: str, verbose: bool = False) -> None:
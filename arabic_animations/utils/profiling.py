@@ -0,0 +1,171 @@
+import os
+import threading
+import time
+from typing import Any, Dict, List, Tuple
+
+class _NullStage:
+    """Context manager doing nothing, used while profiling is disabled"""
+    def __enter__(self) -> None:
+        return None
+
+    def __exit__(self, *exc: Any) -> None:
+        return None
+
+_NULL_STAGE = _NullStage()
+
+class _Stage:
+    """Context manager timing one execution of a stage"""
+    __slots__ = ('profiler', 'name', 'obj', 'start')
+
+    def __init__(self, profiler: 'Profiler', name: str, obj: Any):
+        self.profiler = profiler
+        self.name = name
+        self.obj = obj
+
+    def __enter__(self) -> None:
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc: Any) -> None:
+        self.profiler.record(self.name, self.start, time.perf_counter(), self.obj)
+
+def _percentile(values: List[float], fraction: float) -> float:
+    """Return the value below which the given fraction of sorted values fall"""
+    index = min(len(values) - 1, int(round(fraction * (len(values) - 1))))
+    return values[index]
+
+def _object_label(obj: Any) -> str:
+    """Describe an object in profiling reports"""
+    text = getattr(obj, 'text', None)
+    if isinstance(text, str):
+        short = text if len(text) <= 24 else text[:24] + "…"
+        return f"{type(obj).__name__} {short!r}"
+    return f"{type(obj).__name__} at {id(obj):#x}"
+
+class Profiler:
+    """
+    Collects timings of rendering stages.
+
+    Code is instrumented with ``with profiler.stage(name, obj):``. While
+    profiling is disabled this returns a shared no-op context manager, so
+    instrumentation costs next to nothing.
+
+    Durations are aggregated per stage, and per object for stages given
+    one. With tracing enabled every timed span is also kept so it can be
+    exported in the Chrome trace event format.
+    """
+    def __init__(self) -> None:
+        self.enabled = False
+        self.trace = False
+        self._lock = threading.Lock()
+        self.reset()
+
+    def enable(self, trace: bool = False) -> None:
+        """Start collecting timings, keeping individual spans if trace is set"""
+        self.enabled = True
+        self.trace = trace
+
+    def disable(self) -> None:
+        """Stop collecting timings"""
+        self.enabled = False
+
+    def reset(self) -> None:
+        """Discard collected timings"""
+        self._durations: Dict[str, List[float]] = {}
+        self._objects: Dict[Tuple[str, int], List[Any]] = {}
+        self._events: List[Dict[str, Any]] = []
+        self._origin = time.perf_counter()
+
+    def stage(self, name: str, obj: Any = None) -> Any:
+        """
+        Return a context manager timing a stage
+
+        Args:
+            name: Stage name, such as 'text.stroke'
+            obj: Optional object the time is attributed to
+        """
+        if not self.enabled:
+            return _NULL_STAGE
+        return _Stage(self, name, obj)
+
+    def record(self, name: str, start: float, end: float, obj: Any = None) -> None:
+        """Record a span of a stage measured with time.perf_counter()"""
+        duration = end - start
+        with self._lock:
+            self._durations.setdefault(name, []).append(duration)
+            if obj is not None:
+                entry = self._objects.setdefault((name, id(obj)), [_object_label(obj), 0, 0.0])
+                entry[1] += 1
+                entry[2] += duration
+            if self.trace:
+                event = {
+                    "name": name,
+                    "ph": "X",
+                    "ts": (start - self._origin) * 1e6,
+                    "dur": duration * 1e6,
+                    "pid": os.getpid(),
+                    "tid": threading.get_ident(),
+                }
+                if obj is not None:
+                    event["args"] = {"object": _object_label(obj)}
+                self._events.append(event)
+
+    def summary(self) -> Dict[str, Any]:
+        """
+        Aggregate the collected timings
+
+        Returns:
+            Per-stage count, total, mean and percentiles in seconds, and per
+            object totals for stages that were given objects
+        """
+        with self._lock:
+            stages = {}
+            for name, durations in self._durations.items():
+                ordered = sorted(durations)
+                total = sum(ordered)
+                stages[name] = {
+                    "count": len(ordered),
+                    "total": total,
+                    "mean": total / len(ordered),
+                    "p50": _percentile(ordered, 0.50),
+                    "p95": _percentile(ordered, 0.95),
+                    "p99": _percentile(ordered, 0.99),
+                    "max": ordered[-1],
+                }
+            objects = [{"stage": name, "object": label, "count": count, "total": total}
+                       for (name, _), (label, count, total) in self._objects.items()]
+        objects.sort(key=lambda entry: -entry["total"])
+        return {"stages": stages, "objects": objects}
+
+    def format_summary(self, top_objects: int = 10) -> str:
+        """Format the summary as a text table"""
+        summary = self.summary()
+        stages = summary["stages"]
+        lines = [f"{'stage':<20} {'count':>8} {'total ms':>10} {'mean ms':>9} "
+                 f"{'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}"]
+        for name, stats in sorted(stages.items(), key=lambda item: -item[1]["total"]):
+            lines.append(f"{name:<20} {stats['count']:>8} {stats['total'] * 1000:>10.1f} "
+                         f"{stats['mean'] * 1000:>9.3f} {stats['p50'] * 1000:>9.3f} "
+                         f"{stats['p95'] * 1000:>9.3f} {stats['p99'] * 1000:>9.3f}")
+
+        if summary["objects"]:
+            lines.append("")
+            lines.append(f"{'object':<40} {'stage':<20} {'count':>8} {'total ms':>10}")
+            for entry in summary["objects"][:top_objects]:
+                lines.append(f"{entry['object']:<40} {entry['stage']:<20} "
+                             f"{entry['count']:>8} {entry['total'] * 1000:>10.1f}")
+        return "\n".join(lines)
+
+    def chrome_trace(self) -> Dict[str, Any]:
+        """
+        Return the timings in the Chrome trace event format
+
+        The result can be saved as JSON and opened in chrome://tracing or
+        Perfetto. It also carries the summary under a 'summary' key, which
+        trace viewers ignore.
+        """
+        with self._lock:
+            events = list(self._events)
+        return {"traceEvents": events, "displayTimeUnit": "ms", "summary": self.summary()}
+
+# Profiler shared by the library and the CLI
+profiler = Profiler()
@@ -0,0 +1,267 @@
+import hashlib
+import inspect
+import json
+from dataclasses import asdict
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Mapping, Union
+from arabic_animations.core.scene import Scene
+from arabic_animations.core.text import Text
+from arabic_animations.core.color import Color, Style
+from arabic_animations.core.position import Position, Padding
+
+try:
+    import yaml
+except ImportError:
+    yaml = None
+
+try:
+    import tomllib
+except ImportError:  # Python < 3.11
+    try:
+        import tomli as tomllib
+    except ImportError:
+        tomllib = None
+
+try:
+    import tomli_w
+except ImportError:
+    tomli_w = None
+
+# Version of the scene file format, stored in every normalized scene
+FORMAT_VERSION = 1
+
+# File extensions of scene files and their formats
+SCENE_FORMATS = {'.json': 'json', '.yaml': 'yaml', '.yml': 'yaml', '.toml': 'toml'}
+
+def _defaults(function: Callable) -> Dict[str, Any]:
+    return {name: parameter.default for name, parameter in inspect.signature(function).parameters.items()
+            if parameter.default is not inspect.Parameter.empty}
+
+_SCENE_DEFAULTS = _defaults(Scene.__init__)
+_TEXT_DEFAULTS = _defaults(Text.__init__)
+
+# Types of the plain fields of scenes and texts
+_SCENE_TYPES = {'width': int, 'height': int, 'fps': int, 'incremental': bool, 'tolerance': float}
+_TEXT_TYPES = {'font_name': str, 'font_size': int, 'write_duration': float,
+               'tolerance': float, 'simplify': bool, 'curves': bool}
+
+def _coerce(value: Any, kind: type, where: str) -> Any:
+    """Check a plain value against its type, converting integral numbers between int and float"""
+    if kind is bool:
+        if isinstance(value, bool):
+            return value
+    elif kind is str:
+        if isinstance(value, str):
+            return value
+    elif isinstance(value, (int, float)) and not isinstance(value, bool):
+        if kind is float:
+            return float(value)
+        if float(value).is_integer():
+            return int(value)
+    raise ValueError(f"{where} must be {kind.__name__}, got {value!r}")
+
+def _check_keys(data: Mapping[str, Any], allowed: List[str], where: str) -> None:
+    unknown = set(data) - set(allowed)
+    if unknown:
+        raise ValueError(f"Unknown fields in {where}: {', '.join(sorted(unknown))}")
+
+def _normalize_padding(value: Any, where: str) -> Dict[str, float]:
+    """Accept a number for all sides, a mapping of sides or a [top, right, bottom, left] list"""
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return asdict(Padding.all(float(value)))
+    if isinstance(value, (list, tuple)) and len(value) == 4:
+        return asdict(Padding(*(_coerce(v, float, where) for v in value)))
+    if isinstance(value, Mapping):
+        _check_keys(value, list(asdict(Padding())), where)
+        return {side: _coerce(value.get(side, 0.0), float, f"{where}.{side}") for side in asdict(Padding())}
+    raise ValueError(f"{where} must be a number, a mapping of sides or a list of four numbers")
+
+def _normalize_text(data: Any, where: str) -> Dict[str, Any]:
+    if isinstance(data, str):
+        data = {'text': data}
+    if not isinstance(data, Mapping):
+        raise ValueError(f"{where} must be a mapping or a string")
+    _check_keys(data, ['text', 'position', 'padding', 'style'] + list(_TEXT_TYPES), where)
+    if 'text' not in data:
+        raise ValueError(f"{where} is missing 'text'")
+
+    text: Dict[str, Any] = {'text': _coerce(data['text'], str, f"{where}.text")}
+    position = data.get('position', _TEXT_DEFAULTS['position'].value)
+    try:
+        text['position'] = Position(position).value
+    except ValueError:
+        choices = ', '.join(p.value for p in Position)
+        raise ValueError(f"{where}.position must be one of {choices}, got {position!r}")
+    text['padding'] = _normalize_padding(data.get('padding', 0), f"{where}.padding")
+
+    style = data.get('style') or {}
+    if not isinstance(style, Mapping):
+        raise ValueError(f"{where}.style must be a mapping")
+    try:
+        text['style'] = Style.from_dict(dict(style)).to_dict()
+    except (ValueError, TypeError) as e:
+        raise ValueError(f"{where}.style: {e}")
+
+    for name, kind in _TEXT_TYPES.items():
+        value = data.get(name, _TEXT_DEFAULTS[name])
+        text[name] = None if value is None and _TEXT_DEFAULTS[name] is None else _coerce(value, kind, f"{where}.{name}")
+    return text
+
+def normalize_scene_dict(data: Mapping[str, Any]) -> Dict[str, Any]:
+    """
+    Validate a scene description and fill in every default
+
+    Equivalent descriptions normalize to equal dictionaries, such as a
+    color written in upper or lower case or a missing field and its default.
+
+    Args:
+        data: Scene description, as read from a scene file
+
+    Returns:
+        The normalized description
+
+    Raises:
+        ValueError: If the description is invalid, naming the offending field
+    """
+    if not isinstance(data, Mapping):
+        raise ValueError("A scene must be a mapping")
+    _check_keys(data, ['version', 'background_color', 'serial', 'texts'] + list(_SCENE_TYPES), "scene")
+    version = data.get('version', FORMAT_VERSION)
+    if version != FORMAT_VERSION:
+        raise ValueError(f"Unsupported scene format version {version!r}, expected {FORMAT_VERSION}")
+
+    scene: Dict[str, Any] = {'version': FORMAT_VERSION}
+    for name, kind in _SCENE_TYPES.items():
+        scene[name] = _coerce(data.get(name, _SCENE_DEFAULTS[name]), kind, f"scene.{name}")
+    background = data.get('background_color', Scene().background_color.to_hex())
+    try:
+        scene['background_color'] = Color.from_hex(background).to_hex()
+    except (ValueError, AttributeError):
+        raise ValueError(f"scene.background_color must be a hex color, got {background!r}")
+    scene['serial'] = _coerce(data.get('serial', False), bool, "scene.serial")
+
+    texts = data.get('texts', [])
+    if not isinstance(texts, list):
+        raise ValueError("scene.texts must be a list")
+    scene['texts'] = [_normalize_text(text, f"texts[{i}]") for i, text in enumerate(texts)]
+    return scene
+
+def scene_from_dict(data: Mapping[str, Any]) -> Scene:
+    """Build a scene from its description"""
+    spec = normalize_scene_dict(data)
+    scene = Scene(**{name: spec[name] for name in _SCENE_TYPES})
+    scene.background_color = Color.from_hex(spec['background_color'])
+
+    texts = [Text(text['text'],
+                  position=Position(text['position']),
+                  padding=Padding(**text['padding']),
+                  style=Style.from_dict(text['style']),
+                  **{name: text[name] for name in _TEXT_TYPES})
+             for text in spec['texts']]
+    if texts:
+        scene.add(*texts, serial=spec['serial'])
+    return scene
+
+def scene_to_dict(scene: Scene) -> Dict[str, Any]:
+    """
+    Describe a scene with the scene file format
+
+    Raises:
+        ValueError: If the scene holds objects other than texts, or texts
+            added in several groups, which the format cannot describe
+    """
+    texts = []
+    start = 0.0
+    for obj in scene.objects:
+        if not isinstance(obj, Text):
+            raise ValueError(f"Cannot describe {type(obj).__name__} objects in a scene file")
+        if obj.start_time != (start if scene.serial else 0):
+            raise ValueError("Cannot describe texts added to the scene in several groups")
+        start += obj.duration
+        texts.append({
+            'text': obj.text,
+            'position': obj.position_type.value,
+            'padding': asdict(obj.padding),
+            'style': obj.style.to_dict(),
+            'font_name': obj.font_name,
+            'font_size': obj.font_size,
+            'write_duration': obj.duration,
+            'tolerance': obj.tolerance,
+            'simplify': obj.simplify,
+            'curves': obj.curves,
+        })
+
+    data = {name: getattr(scene, name) for name in _SCENE_TYPES}
+    data.update(background_color=scene.background_color.to_hex(), serial=scene.serial, texts=texts)
+    return normalize_scene_dict(data)
+
+def scene_hash(scene: Union[Scene, Mapping[str, Any]]) -> str:
+    """
+    Return a stable content hash of a scene or scene description
+
+    The hash covers the normalized description, so it does not change
+    with formatting, field order or spelled out defaults. It does not cover
+    the font files, which are looked up by name when rendering.
+    """
+    spec = scene_to_dict(scene) if isinstance(scene, Scene) else normalize_scene_dict(scene)
+    canonical = json.dumps(spec, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+def is_scene_file(path: str) -> bool:
+    """Return whether a path names a declarative scene file rather than a script"""
+    return Path(path).suffix.lower() in SCENE_FORMATS
+
+def _format(path: str) -> str:
+    try:
+        return SCENE_FORMATS[Path(path).suffix.lower()]
+    except KeyError:
+        raise ValueError(f"Unknown scene file extension in {path}, use one of {', '.join(SCENE_FORMATS)}")
+
+def read_scene_file(path: str) -> Dict[str, Any]:
+    """Read the normalized scene description from a JSON, YAML or TOML file"""
+    kind = _format(path)
+    if kind == 'json':
+        with open(path, encoding='utf-8') as f:
+            data = json.load(f)
+    elif kind == 'yaml':
+        if yaml is None:
+            raise ImportError("Reading YAML scene files requires PyYAML (pip install pyyaml)")
+        with open(path, encoding='utf-8') as f:
+            data = yaml.safe_load(f)
+    else:
+        if tomllib is None:
+            raise ImportError("Reading TOML scene files requires Python 3.11 or tomli (pip install tomli)")
+        with open(path, 'rb') as f:
+            data = tomllib.load(f)
+    return normalize_scene_dict(data)
+
+def load_scene_file(path: str) -> Scene:
+    """Build the scene described by a JSON, YAML or TOML file"""
+    return scene_from_dict(read_scene_file(path))
+
+def _without_none(value: Any) -> Any:
+    """Drop None values from nested mappings, as TOML has no null"""
+    if isinstance(value, dict):
+        return {key: _without_none(item) for key, item in value.items() if item is not None}
+    if isinstance(value, list):
+        return [_without_none(item) for item in value]
+    return value
+
+def save_scene_file(scene: Union[Scene, Mapping[str, Any]], path: str) -> None:
+    """Write a scene or scene description to a JSON, YAML or TOML file"""
+    spec = scene_to_dict(scene) if isinstance(scene, Scene) else normalize_scene_dict(scene)
+    kind = _format(path)
+    if kind == 'json':
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(spec, f, indent=2, ensure_ascii=False)
+            f.write('\n')
+    elif kind == 'yaml':
+        if yaml is None:
+            raise ImportError("Writing YAML scene files requires PyYAML (pip install pyyaml)")
+        with open(path, 'w', encoding='utf-8') as f:
+            yaml.safe_dump(spec, f, allow_unicode=True, sort_keys=False)
+    else:
+        if tomli_w is None:
+            raise ImportError("Writing TOML scene files requires tomli-w (pip install tomli-w)")
+        with open(path, 'wb') as f:
+            tomli_w.dump(_without_none(spec), f)
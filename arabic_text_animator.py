@@ -18,6 +18,9 @@ class ArabicTextAnimator:
         """
         Creates an animation of Arabic text being written
 
+        All frames are kept in memory; use iter_frames to stream long
+        animations instead.
+
         Args:
             text: Arabic text to animate
             font_name: Name of the font to use
@@ -29,9 +32,30 @@ class ArabicTextAnimator:
         Returns:
             List of numpy arrays representing frames
         """
+        return list(self.iter_frames(text, font_name, font_size, duration,
+                                     color, stroke_width))
+
+    def iter_frames(self, text, font_name, font_size=128, duration=3,
+                    color=(0, 0, 0), stroke_width=2.0):
+        """
+        Lazily generates the frames of an animation of Arabic text being written
+
+        Frames are produced one at a time, so memory use does not depend on
+        the duration of the animation.
+
+        Args:
+            text: Arabic text to animate
+            font_name: Name of the font to use
+            font_size: Font size in points
+            duration: Duration of animation in seconds
+            color: RGB tuple for text color (0-1 range)
+            stroke_width: Width of the stroke
+
+        Yields:
+            Numpy arrays representing frames in BGR format
+        """
         # Calculate number of frames
         n_frames = int(duration * self.fps)
-        frames = []
 
         # Create surface and context
         surface = cairo.ImageSurface(cairo.FORMAT_ARGB32, self.width, self.height)
@@ -140,18 +164,22 @@ class ArabicTextAnimator:
                 ctx.stroke()
                 ctx.new_path()
 
-            # Convert to numpy array and append to frames
+            # Convert to numpy array and hand the frame to the caller
             data = surface.get_data()
             arr = np.ndarray(shape=(self.height, self.width, 4),
                            dtype=np.uint8,
                            buffer=data)
-            frame_bgr = cv2.cvtColor(arr, cv2.COLOR_BGRA2BGR)
-            frames.append(frame_bgr)
-
-        return frames
+            yield cv2.cvtColor(arr, cv2.COLOR_BGRA2BGR)
 
     def save_video(self, frames, output_path):
-        """Saves frames as MP4 video"""
+        """
+        Saves frames as MP4 video
+
+        Args:
+            frames: Iterable of BGR frames, such as a list from create_animation
+                or the generator returned by iter_frames
+            output_path: Path of the video file to write
+        """
         fourcc = cv2.VideoWriter_fourcc(*'mp4v')
         out = cv2.VideoWriter(output_path, fourcc, self.fps,
                             (self.width, self.height))
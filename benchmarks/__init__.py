@@ -0,0 +1 @@
+"""Performance benchmarks for the Arabic Animations rendering engine."""
@@ -0,0 +1,40 @@
+import os
+import tempfile
+import zipfile
+from pathlib import Path
+
+# Fonts shipped in the repository, available offline
+BUNDLED_FONTS = Path(__file__).resolve().parent.parent / "fonts" / "Arabic"
+
+# Family used by the benchmarks, from the bundled DecoType Thuluth II archive
+BENCHMARK_FONT = "DecoType Thuluth II"
+
+def install_bundled_fonts(font_dir: Path = BUNDLED_FONTS) -> Path:
+    """
+    Extract the bundled fonts and make fontconfig use only them
+
+    This must run before Pango is first imported, since fontconfig reads its
+    configuration once. Using only the bundled fonts keeps results
+    independent of the fonts installed on the machine.
+
+    Args:
+        font_dir: Directory containing font .zip archives
+
+    Returns:
+        Directory the fonts were extracted to
+    """
+    target = Path(tempfile.mkdtemp(prefix="ata-bench-fonts-"))
+    for archive in sorted(font_dir.glob("*.zip")):
+        with zipfile.ZipFile(archive) as zf:
+            zf.extractall(target)
+
+    config = target / "fonts.conf"
+    config.write_text(f"""<?xml version="1.0"?>
+<!DOCTYPE fontconfig SYSTEM "fonts.dtd">
+<fontconfig>
+  <dir>{target}</dir>
+  <cachedir>{target / "cache"}</cachedir>
+</fontconfig>
+""")
+    os.environ["FONTCONFIG_FILE"] = str(config)
+    return target
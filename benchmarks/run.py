@@ -0,0 +1,315 @@
+"""
+Benchmark suite for the rendering engine.
+
+Run from the repository root:
+
+    python -m benchmarks.run --output baseline.json
+    python -m benchmarks.run --output results.json --compare baseline.json
+
+Results are written as JSON. With --compare, every benchmark whose median
+is slower than the baseline by more than the threshold is reported as a
+regression and the command exits with status 1. Timings depend on the
+machine, so no baseline is shipped: record one with --output on the same
+machine, for example from the main branch, before comparing against it.
+"""
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, Dict, Any, List, Optional, Tuple
+
+import click
+
+from .fonts import install_bundled_fonts, BENCHMARK_FONT
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+TEXTS = {
+    "word": "بسم",
+    "line": "بسم الله الرحمن الرحيم",
+    "paragraph": "\n".join([
+        "بسم الله الرحمن الرحيم",
+        "الحمد لله رب العالمين",
+        "اللهم صل على محمد وعلى آل محمد",
+        "أما بعد",
+    ]),
+}
+TEXTS["page"] = "\n".join([TEXTS["paragraph"]] * 6)
+
+RESOLUTIONS = {
+    "720p": (1280, 720),
+    "1080p": (1920, 1080),
+    "1440p": (2560, 1440),
+    "4k": (3840, 2160),
+}
+
+STYLES = ["plain", "fill", "shadow", "glow", "gradient"]
+
+Result = Dict[str, Any]
+
+def measure(function: Callable[[], Any], repeat: int, warmup: int = 1, per: int = 1) -> Result:
+    """
+    Time a function
+
+    Args:
+        function: Function to time
+        repeat: Number of timed runs
+        warmup: Number of untimed runs first
+        per: Number of operations per run, to report time per operation
+
+    Returns:
+        Timing statistics in seconds per operation
+    """
+    for _ in range(warmup):
+        function()
+
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append((time.perf_counter() - start) / per)
+
+    return {
+        "unit": "s",
+        "median": statistics.median(times),
+        "mean": statistics.mean(times),
+        "min": min(times),
+        "max": max(times),
+        "runs": repeat,
+    }
+
+def peak_memory_mb(children: bool = False) -> Optional[float]:
+    """Return the peak resident memory of this process or its children in MB"""
+    if resource is None:
+        return None
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF)
+    # ru_maxrss is in bytes on macOS and kilobytes elsewhere
+    scale = 1 if sys.platform == "darwin" else 1024
+    return usage.ru_maxrss * scale / (1024 * 1024)
+
+def make_style(name: str):
+    """Return the Style used by a style benchmark"""
+    from arabic_animations.core.color import Style, Color, Colors
+
+    if name == "fill":
+        return Style(fill_color=Color.from_hex("#FFD700"), stroke_width=3.0)
+    if name == "shadow":
+        return Style(shadow_color=Color.from_hex("#00000066"), shadow_offset=(5, 5), shadow_blur=4.0)
+    if name == "glow":
+        return Style(glow_color=Color.from_hex("#FFFFFF99"), glow_radius=6.0)
+    if name == "gradient":
+        return Style(gradient=(Colors.PRIMARY, Colors.SECONDARY), gradient_direction=(0, 50))
+    return Style()
+
+def make_scene(text: str, style: str = "plain", resolution: str = "1080p",
+               incremental: bool = False, fps: int = 60, duration: float = 2.0):
+    """Build a scene holding a single text, scaled to the resolution"""
+    from arabic_animations.core.scene import Scene
+    from arabic_animations.core.text import Text
+
+    width, height = RESOLUTIONS[resolution]
+    scene = Scene(width=width, height=height, fps=fps, incremental=incremental)
+    scene.add(Text(text, font_name=BENCHMARK_FONT, font_size=int(72 * height / 1080),
+                   style=make_style(style), write_duration=duration))
+    return scene
+
+def make_subtitle_scene(words: int, word_duration: float = 0.5):
+    """Build a scene writing words one after another over a backdrop written for the whole scene"""
+    from arabic_animations.core.scene import Scene
+    from arabic_animations.core.text import Text
+
+    scene = Scene(width=1280, height=720, fps=60)
+    scene.add(Text(TEXTS["line"], font_name=BENCHMARK_FONT, font_size=48,
+                   write_duration=words * word_duration), layer=-1)
+    scene.add(*[Text(TEXTS["word"], font_name=BENCHMARK_FONT, font_size=32, write_duration=word_duration)
+                for _ in range(words)], serial=True)
+    return scene
+
+def bench_frames(scene, frames: int, repeat: int) -> Result:
+    """Time rendering a sequence of frames spread over the scene, per frame"""
+    import numpy as np
+
+    buffer = np.empty((scene.height, scene.width, 4), dtype=np.uint8)
+    times = [scene.duration * i / frames for i in range(frames)]
+
+    def play() -> None:
+        for t in times:
+            scene.render_frame(t, buffer)
+
+    return measure(play, repeat, per=frames)
+
+def bench_construction(repeat: int) -> Dict[str, Result]:
+    from arabic_animations.core.text import Text
+    from arabic_animations.core.cache import layout_cache, path_cache, outline_store
+
+    def cold(text: str) -> Callable[[], Any]:
+        def build() -> None:
+            layout_cache.clear()
+            path_cache.clear()
+            Text(text, font_name=BENCHMARK_FONT)
+        return build
+
+    # Cold construction shapes and flattens, so outlines stored on disk by
+    # ATA_CACHE_DIR must not be loaded instead
+    directory = outline_store.directory
+    outline_store.open(None)
+    try:
+        results = {}
+        for name, text in TEXTS.items():
+            results[f"construct/cold/{name}"] = measure(cold(text), repeat)
+            results[f"construct/warm/{name}"] = measure(lambda: Text(text, font_name=BENCHMARK_FONT), repeat)
+    finally:
+        outline_store.open(directory)
+    return results
+
+def bench_render(frames: int, repeat: int) -> Dict[str, Result]:
+    results = {}
+    for style in STYLES:
+        results[f"frame/style/{style}"] = bench_frames(make_scene(TEXTS["line"], style), frames, repeat)
+    results["frame/style/plain-incremental"] = bench_frames(
+        make_scene(TEXTS["line"], incremental=True), frames, repeat)
+    for name, text in TEXTS.items():
+        results[f"frame/length/{name}"] = bench_frames(make_scene(text), frames, repeat)
+    for resolution in RESOLUTIONS:
+        results[f"frame/resolution/{resolution}"] = bench_frames(
+            make_scene(TEXTS["line"], resolution=resolution), frames, repeat)
+    return results
+
+def bench_timeline_frames(scene, frames: int, repeat: int) -> Result:
+    """Time consecutive frames from the middle of the scene on, per frame"""
+    import numpy as np
+
+    buffer = np.empty((scene.height, scene.width, 4), dtype=np.uint8)
+    # Every run continues where the previous one stopped, as a render does
+    indices = iter(range(int(scene.duration * scene.fps) // 2, int(scene.duration * scene.fps)))
+
+    def play() -> None:
+        for _ in range(frames):
+            scene.render_frame(next(indices) / scene.fps, buffer)
+
+    return measure(play, repeat, per=frames)
+
+def bench_timeline(frames: int, repeat: int) -> Dict[str, Result]:
+    """
+    Time scenes with an early object outlasting many later ones
+
+    A backdrop on a lower layer is written for the whole scene while words
+    are written one after another over it. The time per frame should not
+    grow with the number of words finished.
+    """
+    return {f"frame/timeline/{words}-words": bench_timeline_frames(make_subtitle_scene(words), frames, repeat)
+            for words in (100, 1000)}
+
+def bench_cli(workers: int) -> Dict[str, Result]:
+    """Run 'ata render' on a generated script and measure end-to-end throughput"""
+    fps, duration = 60, 2.0
+    with tempfile.TemporaryDirectory(prefix="ata-bench-") as tmp:
+        script = Path(tmp) / "scene.py"
+        script.write_text(f"""
+from arabic_animations.core.scene import Scene
+from arabic_animations.core.text import Text
+
+scene = Scene(width=1920, height=1080, fps={fps})
+scene.add(Text({TEXTS["paragraph"]!r}, font_name={BENCHMARK_FONT!r}, write_duration={duration}))
+""")
+        command = [sys.executable, "-m", "arabic_animations.main", "render", str(script),
+                   "--output", str(Path(tmp) / "out.mp4"), "--workers", str(workers)]
+        start = time.perf_counter()
+        subprocess.run(command, check=True, capture_output=True)
+        elapsed = time.perf_counter() - start
+
+    frames = int(fps * duration)
+    return {f"cli/render/workers-{workers}": {
+        "unit": "fps",
+        "median": frames / elapsed,
+        "seconds": elapsed,
+        "frames": frames,
+        "peak_memory_mb": peak_memory_mb(children=True),
+    }}
+
+def compare(results: Dict[str, Result], baseline: Dict[str, Result],
+            threshold: float) -> List[Tuple[str, float, float, float]]:
+    """
+    Compare results with a baseline
+
+    Returns:
+        (name, baseline, current, relative change) for every regression,
+        where the change is positive when the result got worse
+    """
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline or not baseline[name].get("median") or not result.get("median"):
+            continue
+        before, after = baseline[name]["median"], result["median"]
+        # Throughput and time move in opposite directions
+        change = before / after - 1 if result["unit"] == "fps" else after / before - 1
+        if change > threshold:
+            regressions.append((name, before, after, change))
+    return regressions
+
+@click.command()
+@click.option("--output", type=click.Path(), help="Write results as JSON to this path")
+@click.option("--compare", "baseline_path", type=click.Path(dir_okay=False),
+              help="Baseline JSON written by --output on this machine to check for regressions")
+@click.option("--threshold", default=0.10, show_default=True,
+              help="Relative slowdown reported as a regression")
+@click.option("--repeat", default=5, show_default=True, help="Timed runs per benchmark")
+@click.option("--frames", default=30, show_default=True, help="Frames rendered per frame benchmark run")
+@click.option("--skip-cli", is_flag=True, help="Skip the end-to-end 'ata render' benchmark")
+@click.option("--workers", default=1, show_default=True, help="Workers for the end-to-end benchmark")
+def main(output: Optional[str], baseline_path: Optional[str], threshold: float,
+         repeat: int, frames: int, skip_cli: bool, workers: int) -> None:
+    """Run the rendering benchmarks"""
+    if baseline_path and not Path(baseline_path).exists():
+        raise click.UsageError(
+            f"Baseline {baseline_path} does not exist. Timings depend on the machine, so record "
+            f"a baseline here first, for example on the main branch:\n\n"
+            f"    python -m benchmarks.run --output {baseline_path}")
+    install_bundled_fonts()
+
+    results: Dict[str, Result] = {}
+    results.update(bench_construction(repeat))
+    results.update(bench_render(frames, repeat))
+    results.update(bench_timeline(frames, repeat))
+    results["memory/peak"] = {"unit": "MB", "median": peak_memory_mb()}
+    if not skip_cli:
+        results.update(bench_cli(workers))
+
+    for name, result in results.items():
+        value = result["median"]
+        if value is None:
+            continue
+        if result["unit"] == "s":
+            click.echo(f"{name:<40} {value * 1000:10.3f} ms")
+        else:
+            click.echo(f"{name:<40} {value:10.1f} {result['unit']}")
+
+    if output:
+        report = {
+            "meta": {
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            },
+            "results": results,
+        }
+        Path(output).write_text(json.dumps(report, indent=2))
+
+    if baseline_path:
+        baseline = json.loads(Path(baseline_path).read_text())["results"]
+        regressions = compare(results, baseline, threshold)
+        for name, before, after, change in regressions:
+            click.echo(f"REGRESSION {name}: {before:.6g} -> {after:.6g} ({change:+.1%})")
+        if regressions:
+            sys.exit(1)
+        click.echo(f"No regressions beyond {threshold:.0%} against {baseline_path}")
+
+if __name__ == "__main__":
+    main()
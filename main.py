@@ -2,8 +2,8 @@ from arabic_text_animator import ArabicTextAnimator
 
 animator = ArabicTextAnimator(1920, 1080, 60)
 
-# Create animation
-frames = animator.create_animation(
+# Create animation, generating frames lazily as the video is written
+frames = animator.iter_frames(
     text="""
             بسم الله الرحمن الرحيم
                 الحمد لله رب العالمين
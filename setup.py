@@ -15,7 +15,7 @@ setup(
     author="Saqib Ahmed",
     author_email="saqibahmed515@gmail.com",
     url="https://github.com/saqib-ahmed/arabic-text-animator",
-    packages=find_packages(),
+    packages=find_packages(exclude=['benchmarks', 'benchmarks.*']),
     classifiers=[
         "Development Status :: 3 - Alpha",
         "Intended Audience :: Developers",
@@ -49,6 +49,11 @@ setup(
             'mkdocstrings-python>=1.7.0',
             'mike>=1.1.2',
         ],
+        'scenes': [
+            'PyYAML>=6.0',
+            'tomli>=2.0.1; python_version < "3.11"',
+            'tomli-w>=1.0.0',
+        ],
     },
     entry_points={
         'console_scripts': [